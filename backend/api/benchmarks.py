@@ -0,0 +1,34 @@
+import tempfile
+from contextlib import contextmanager
+
+from django.test.utils import (override_settings, setup_databases,
+                               setup_test_environment, teardown_databases,
+                               teardown_test_environment)
+
+from recipes.images import wait_for_thumbnails
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    },
+}
+
+
+@contextmanager
+def benchmark_environment():
+    """Тестовая БД, временный MEDIA_ROOT и отдельный кеш в памяти на время
+    бенчмарка, рабочие данные не затрагиваются."""
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root, CACHES=CACHES):
+            try:
+                yield
+            finally:
+                # Фоновые задачи пишут в MEDIA_ROOT бенчмарка.
+                wait_for_thumbnails()
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
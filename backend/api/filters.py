@@ -1,14 +1,35 @@
+import re
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, TrigramSimilarity)
+from django.db import connection
+from django.db.models import (Case, CharField, F, FloatField, Func,
+                              IntegerField, Q, Value, When)
+from django.db.models.lookups import PostgresOperatorLookup
+from django.utils.functional import cached_property
 from django_filters.rest_framework import FilterSet, filters
+from rest_framework.filters import SearchFilter
+
+from recipes.models import Ingredient, Recipe, RecipeTag
+from recipes.reference_data import get_tag_ids
 
-from recipes.models import Ingredient, Recipe, Tag
+TAGS_MODE_ANY = 'any'
+TAGS_MODE_ALL = 'all'
 
 
 class RecipeFilter(FilterSet):
+    """Фильтр рецептов. Теги - подзапросами IN по id, полученным из slug
+    через кеш: без соединения с тегами рецепты не размножаются и DISTINCT
+    не нужен. tags_mode=all - рецепты со всеми тегами, по умолчанию - с
+    любым из них."""
 
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all()
+    tags = filters.MultipleChoiceFilter(
+        method='filter_tags',
+    )
+    tags_mode = filters.ChoiceFilter(
+        choices=((TAGS_MODE_ANY, TAGS_MODE_ANY),
+                 (TAGS_MODE_ALL, TAGS_MODE_ALL)),
+        method='filter_tags_mode',
     )
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_recipe_in_shopping_cart',
@@ -19,8 +40,40 @@ class RecipeFilter(FilterSet):
 
     class Meta:
         model = Recipe
-        fields = ('name', 'tags', 'author', 'is_in_shopping_cart',
-                  'is_favorited')
+        fields = ('name', 'tags', 'tags_mode', 'author',
+                  'is_in_shopping_cart', 'is_favorited')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Проверка slug и перевод в id - по одной выборке из кеша и только
+        # для запросов с тегами.
+        if self.data.get('tags'):
+            self.filters['tags'].extra['choices'] = self.tag_choices
+
+    @cached_property
+    def tag_ids(self):
+        return get_tag_ids()
+
+    def tag_choices(self):
+        return [(slug, slug) for slug in self.tag_ids]
+
+    def filter_tags(self, queryset, name, value):
+        tag_ids = {self.tag_ids[slug] for slug in value}
+        if self.form.cleaned_data.get('tags_mode') == TAGS_MODE_ALL:
+            # Подзапрос на каждый тег. На PostgreSQL он в 2-4 раза
+            # быстрее одного подзапроса GROUP BY ... HAVING COUNT(DISTINCT)
+            # (tag_filter_benchmark), на SQLite с двумя и более тегами
+            # медленнее соединения с тегами.
+            for tag_id in tag_ids:
+                queryset = queryset.filter(pk__in=RecipeTag.objects.filter(
+                    tag_id=tag_id).values('recipe_id'))
+            return queryset
+        return queryset.filter(pk__in=RecipeTag.objects.filter(
+            tag_id__in=tag_ids).values('recipe_id'))
+
+    def filter_tags_mode(self, queryset, name, value):
+        # Учитывается в filter_tags.
+        return queryset
 
     def filter_recipe_in_shopping_cart(self, queryset, name, value):
         user = self.request.user
@@ -45,3 +98,67 @@ class IngredientFilter(FilterSet):
     class Meta:
         model = Ingredient
         fields = ('name', )
+
+
+SEARCH_CONFIG = 'russian'
+
+
+@CharField.register_lookup
+class TrigramWordSimilar(PostgresOperatorLookup):
+    """Похожесть строки на любое слово поля (pg_trgm, оператор %>)."""
+    lookup_name = 'trigram_word_similar'
+    postgres_operator = '%%>'
+
+
+class RecipeSearchFilter(SearchFilter):
+    """Поиск рецептов.
+
+    По умолчанию - по началу названия. С ?search_mode=fulltext на
+    PostgreSQL - полнотекстовый поиск по названию и описанию и
+    триграммный по названию (устойчив к опечаткам) с ранжированием по
+    релевантности; на SQLite - вхождение всех слов в название или описание.
+    """
+    search_mode_param = 'search_mode'
+    fulltext_mode = 'fulltext'
+
+    def filter_queryset(self, request, queryset, view):
+        mode = request.query_params.get(self.search_mode_param)
+        if mode != self.fulltext_mode:
+            return super().filter_queryset(request, queryset, view)
+
+        terms = request.query_params.get(self.search_param, '').strip()
+        if not terms:
+            return queryset
+        if connection.vendor == 'postgresql':
+            return self.postgres_search(queryset, terms)
+        return self.fallback_search(queryset, terms)
+
+    def postgres_search(self, queryset, terms):
+        # Выражение совпадает с индексом recipe_search_vector_idx.
+        vector = (SearchVector('name', weight='A', config=SEARCH_CONFIG)
+                  + SearchVector('text', weight='B', config=SEARCH_CONFIG))
+        query = SearchQuery(terms, config=SEARCH_CONFIG,
+                            search_type='websearch')
+        word_similarity = Func(
+            Value(terms), F('name'), function='WORD_SIMILARITY',
+            output_field=FloatField())
+        return queryset.annotate(search_vector=vector).filter(
+            Q(search_vector=query) | Q(name__trigram_word_similar=terms)
+        ).annotate(
+            search_rank=SearchRank(vector, query)
+            + TrigramSimilarity('name', terms) + word_similarity
+        ).order_by('-search_rank', '-pub_date')
+
+    def fallback_search(self, queryset, terms):
+        # iregex в SQLite выполняется модулем re и, в отличие от icontains,
+        # не чувствителен к регистру кириллицы.
+        condition = Q()
+        rank = Value(0)
+        for word in map(re.escape, terms.split()):
+            condition &= Q(name__iregex=word) | Q(text__iregex=word)
+            rank += Case(
+                When(name__iregex=word, then=Value(2)),
+                When(text__iregex=word, then=Value(1)),
+                default=Value(0), output_field=IntegerField())
+        return queryset.filter(condition).annotate(
+            search_rank=rank).order_by('-search_rank', '-pub_date')
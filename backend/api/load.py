@@ -0,0 +1,304 @@
+"""Нагрузочное тестирование API смесью запросов.
+
+Запросы с весами ENDPOINTS выполняются в нескольких потоках к приложению
+api_foodgram.wsgi в том же процессе (WSGITransport) или к серверу по HTTP
+(HTTPTransport), например к gunicorn на localhost. Пользователи - из
+generate_dataset: каждый запрос выполняется от случайного из них, рецепты
+и авторы выбираются по закону Ципфа, как и при генерации данных.
+
+В одном процессе потоки делят GIL, поэтому пропускная способность ниже,
+чем у нескольких процессов gunicorn; такой режим удобен для сравнения
+изменений на одной машине без сервера.
+"""
+import http.client
+import io
+import itertools
+import json
+import math
+import random
+import sys
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+from django.conf import settings
+
+from recipes.synthetic import (SYNTHETIC_PASSWORD, SYNTHETIC_PREFIX,
+                               zipf_weights)
+
+# Сколько страниц рецептов просматривается при подготовке.
+DISCOVERY_PAGES = 10
+DISCOVERY_PAGE_SIZE = 50
+
+
+class WSGITransport:
+    """Вызов приложения WSGI в том же процессе, без сети."""
+
+    def __init__(self, application):
+        self.application = application
+
+    def request(self, method, path, body=b'', headers=None):
+        path, _, query = path.partition('?')
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'localhost',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in (headers or {}).items():
+            key = name.upper().replace('-', '_')
+            environ[key if key == 'CONTENT_TYPE' else f'HTTP_{key}'] = value
+        status = []
+
+        def start_response(status_line, response_headers, exc_info=None):
+            status.append(int(status_line.split(' ', 1)[0]))
+
+        response = self.application(environ, start_response)
+        try:
+            content = b''.join(response)
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+        return status[0], content
+
+
+class HTTPTransport:
+    """Запросы по HTTP, у каждого потока свое постоянное соединение."""
+
+    def __init__(self, url, timeout=30):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f'Unsupported URL: {url}')
+        self.connection_class = (http.client.HTTPSConnection
+                                 if parts.scheme == 'https'
+                                 else http.client.HTTPConnection)
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def request(self, method, path, body=b'', headers=None):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = self.connection_class(
+                self.netloc, timeout=self.timeout)
+        try:
+            connection.request(method, self.prefix + path, body,
+                               headers or {})
+            response = connection.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            # Следующий запрос откроет новое соединение.
+            connection.close()
+            self.local.connection = None
+            raise
+
+
+class Endpoint:
+    """Запрос смеси с весом weight: path(context, rnd) строит путь, метод
+    выбирается случайно из methods (например, добавление и удаление).
+
+    statuses - ожидаемые статусы: повторное добавление и удаление
+    отсутствующего возвращают 400 и ошибкой не считаются.
+    """
+
+    def __init__(self, name, methods, path, weight, auth=True,
+                 statuses=(200, )):
+        self.name = name
+        self.methods = methods
+        self.path = path
+        self.weight = weight
+        self.auth = auth
+        self.statuses = statuses
+
+    def build(self, context, rnd):
+        return rnd.choice(self.methods), self.path(context, rnd)
+
+
+def _page(context, rnd):
+    # Первые страницы открывают чаще остальных.
+    return min(context['pages'], 1 + int(rnd.expovariate(0.5)))
+
+
+def _recipe_id(context, rnd):
+    return rnd.choices(context['recipe_ids'],
+                       cum_weights=context['recipe_weights'])[0]
+
+
+def _author_id(context, rnd):
+    return rnd.choices(context['author_ids'],
+                       cum_weights=context['author_weights'])[0]
+
+
+def _tags(context, rnd):
+    return '&'.join(f'tags={slug}' for slug in rnd.sample(
+        context['tag_slugs'], min(len(context['tag_slugs']),
+                                  rnd.randint(1, 2))))
+
+
+def _ingredient_prefix(context, rnd):
+    name = rnd.choice(context['ingredient_names'])
+    return quote(name[:rnd.randint(1, len(name))])
+
+
+ENDPOINTS = (
+    Endpoint('recipes-list-anonymous', ('GET', ),
+             lambda context, rnd: f'/api/recipes/?page={_page(context, rnd)}',
+             25, auth=False),
+    Endpoint('recipes-list', ('GET', ),
+             lambda context, rnd: f'/api/recipes/?page={_page(context, rnd)}',
+             15),
+    Endpoint('recipes-list-tags', ('GET', ),
+             lambda context, rnd: f'/api/recipes/?{_tags(context, rnd)}', 10,
+             auth=False),
+    Endpoint('recipes-list-favorited', ('GET', ),
+             lambda context, rnd: '/api/recipes/?is_favorited=1', 3),
+    Endpoint('recipes-detail', ('GET', ),
+             lambda context, rnd: f'/api/recipes/{_recipe_id(context, rnd)}/',
+             15, auth=False),
+    Endpoint('ingredients-search', ('GET', ),
+             lambda context, rnd:
+             f'/api/ingredients/?name={_ingredient_prefix(context, rnd)}',
+             8, auth=False),
+    Endpoint('tags-list', ('GET', ), lambda context, rnd: '/api/tags/', 3,
+             auth=False),
+    Endpoint('users-me', ('GET', ), lambda context, rnd: '/api/users/me/', 3),
+    Endpoint('users-subscriptions', ('GET', ),
+             lambda context, rnd: '/api/users/subscriptions/?recipes_limit=3',
+             4),
+    Endpoint('recipes-favorite', ('POST', 'DELETE'),
+             lambda context, rnd:
+             f'/api/recipes/{_recipe_id(context, rnd)}/favorite/',
+             5, statuses=(201, 204, 400)),
+    Endpoint('recipes-shopping-cart', ('POST', 'DELETE'),
+             lambda context, rnd:
+             f'/api/recipes/{_recipe_id(context, rnd)}/shopping_cart/',
+             4, statuses=(201, 204, 400)),
+    Endpoint('users-subscribe', ('POST', 'DELETE'),
+             lambda context, rnd:
+             f'/api/users/{_author_id(context, rnd)}/subscribe/',
+             3, statuses=(201, 204, 400)),
+    Endpoint('recipes-download-shopping-cart', ('GET', ),
+             lambda context, rnd: '/api/recipes/download_shopping_cart/', 2),
+)
+
+
+def request_json(transport, method, path, data=None, token=None):
+    body = json.dumps(data).encode() if data is not None else b''
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f'Token {token}'
+    status, content = transport.request(method, path, body, headers)
+    if status >= 400:
+        raise ValueError(f'{method} {path}: {status} {content[:200]!r}')
+    return json.loads(content) if content else None
+
+
+def prepare_context(transport, users, seed=0):
+    """Токены users синтетических пользователей и id рецептов, авторов,
+    slug тегов и названия ингредиентов, полученные через API."""
+    tokens = [
+        request_json(transport, 'POST', '/api/auth/token/login/', {
+            'email': f'{SYNTHETIC_PREFIX}{index}@example.com',
+            'password': SYNTHETIC_PASSWORD})['auth_token']
+        for index in range(users)]
+    recipes = []
+    for page in range(1, DISCOVERY_PAGES + 1):
+        data = request_json(
+            transport, 'GET',
+            f'/api/recipes/?page={page}&limit={DISCOVERY_PAGE_SIZE}')
+        recipes.extend(data['results'])
+        if not data['next']:
+            break
+    if not recipes:
+        raise ValueError('No recipes found, run generate_dataset first!')
+    # Популярность - по рангу в случайном порядке, как в generate_dataset.
+    rnd = random.Random(seed)
+    recipe_ids = [recipe['id'] for recipe in recipes]
+    author_ids = list({recipe['author']['id'] for recipe in recipes})
+    rnd.shuffle(recipe_ids)
+    rnd.shuffle(author_ids)
+    return {
+        'tokens': tokens,
+        'pages': max(1, math.ceil(data['count'] / settings.PAGE_SIZE)),
+        'recipe_ids': recipe_ids,
+        'recipe_weights': zipf_weights(len(recipe_ids), 1),
+        'author_ids': author_ids,
+        'author_weights': zipf_weights(len(author_ids), 1),
+        'tag_slugs': [tag['slug'] for tag in request_json(
+            transport, 'GET', '/api/tags/')],
+        'ingredient_names': [ingredient['name'] for ingredient in request_json(
+            transport, 'GET', f'/api/ingredients/?name={SYNTHETIC_PREFIX}')]
+        or [SYNTHETIC_PREFIX],
+    }
+
+
+def percentile(values, share):
+    """Перцентиль по ближайшему рангу, values отсортированы."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(len(values) * share / 100) - 1)]
+
+
+def run_load(transport, endpoints, context, concurrency, duration, warmup=0,
+             seed=0):
+    """Запросы смеси endpoints в concurrency потоках в течение warmup +
+    duration секунд. Возвращает {имя: (длительности в с, ошибки)} за
+    duration секунд после прогрева и фактическую длительность замера."""
+    cum_weights = list(itertools.accumulate(
+        endpoint.weight for endpoint in endpoints))
+    started = time.perf_counter()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+    results = []
+
+    def worker(index):
+        rnd = random.Random(seed + index)
+        latencies = {endpoint.name: [] for endpoint in endpoints}
+        errors = dict.fromkeys(latencies, 0)
+        results.append((latencies, errors))
+        while True:
+            request_started = time.perf_counter()
+            if request_started >= deadline:
+                return
+            endpoint = rnd.choices(endpoints, cum_weights=cum_weights)[0]
+            method, path = endpoint.build(context, rnd)
+            headers = {}
+            if endpoint.auth:
+                headers['Authorization'] = (
+                    f'Token {rnd.choice(context["tokens"])}')
+            try:
+                status, _ = transport.request(method, path, b'', headers)
+            except (OSError, http.client.HTTPException):
+                status = None
+            if request_started >= measure_from:
+                latencies[endpoint.name].append(
+                    time.perf_counter() - request_started)
+                errors[endpoint.name] += status not in endpoint.statuses
+
+    threads = [threading.Thread(target=worker, args=(index, ), daemon=True)
+               for index in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - measure_from
+    merged = {}
+    for endpoint in endpoints:
+        latencies = sorted(
+            value for thread_latencies, _ in results
+            for value in thread_latencies[endpoint.name])
+        merged[endpoint.name] = (latencies, sum(
+            thread_errors[endpoint.name] for _, thread_errors in results))
+    return merged, elapsed
@@ -0,0 +1,496 @@
+import json
+import platform
+import statistics
+import time
+
+import django
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.benchmarks import benchmark_environment
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (Cart, Favorite, Ingredient, Recipe,
+                            RecipeIngredient, Tag)
+from recipes.reference_data import RECIPES, bump_version
+from recipes.synthetic import (SYNTHETIC_IMAGE, SYNTHETIC_PASSWORD,
+                               SYNTHETIC_PREFIX, seed_dataset)
+from users.models import Follow, User
+
+# PNG 1x1, достаточно для прохождения валидации Base64ImageField.
+PIXEL_PNG = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAA'
+             'fFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg==')
+# Число рецептов в запросах массового добавления/удаления.
+BULK_SIZE = 20
+# Число ингредиентов в рецепте для бенчмарка редактирования.
+LARGE_RECIPE_SIZE = 40
+# Сколько ингредиентов заменяется и у скольких меняется количество.
+LARGE_RECIPE_REPLACED = 5
+LARGE_RECIPE_CHANGED = 10
+
+
+class Scenario:
+    """Запрос к одному маршруту API и его бюджет.
+
+    path и data могут быть функциями от контекста бенчмарка, prepare
+    выполняется перед замером и в бюджет не входит. Для cold общий кеш
+    списка рецептов сбрасывается перед каждым замером, и бюджет проверяет
+    запросы самого queryset.
+    """
+
+    def __init__(self, name, method, path, queries, ms, auth=True,
+                 paginated=False, data=None, prepare=None, repeat=True,
+                 status=200, cold=False):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.queries = queries
+        self.ms = ms
+        self.auth = auth
+        self.paginated = paginated
+        self.data = data
+        self.prepare = prepare
+        self.repeat = repeat
+        self.status = status
+        self.cold = cold
+
+    def build_path(self, context, page_size):
+        path = self.path(context) if callable(self.path) else self.path
+        if page_size is not None:
+            separator = '&' if '?' in path else '?'
+            path = f'{path}{separator}limit={page_size}'
+        return path
+
+    def build_data(self, context):
+        return self.data(context) if callable(self.data) else self.data
+
+
+def _unfavorite(context):
+    Favorite.objects.filter(user=context['user'],
+                            recipe=context['recipe']).delete()
+
+
+def _remove_from_cart(context):
+    Cart.objects.filter(user=context['user'],
+                        recipe=context['recipe']).delete()
+
+
+def _unfavorite_bulk(context):
+    Favorite.objects.filter(user=context['user'],
+                            recipe__in=context['recipe_ids']).delete()
+
+
+def _remove_from_cart_bulk(context):
+    Cart.objects.filter(user=context['user'],
+                        recipe__in=context['recipe_ids']).delete()
+
+
+def _bulk_payload(context):
+    return {'recipes': context['recipe_ids']}
+
+
+def _unfollow(context):
+    Follow.objects.filter(user=context['user'],
+                          following=context['author']).delete()
+
+
+def _recipe_payload(context):
+    return {
+        'name': 'Рецепт бенчмарка',
+        'text': 'Описание',
+        'cooking_time': 10,
+        'image': PIXEL_PNG,
+        'tags': context['tag_ids'],
+        'ingredients': [{'id': ingredient_id, 'amount': 10}
+                        for ingredient_id in context['ingredient_ids']],
+    }
+
+
+def _create_large_recipe(context):
+    """Рецепт из LARGE_RECIPE_SIZE ингредиентов в корзине пользователя."""
+    recipe = Recipe.objects.create(
+        author=context['user'], name='Большой рецепт бенчмарка',
+        text='Описание', cooking_time=10, image=SYNTHETIC_IMAGE)
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient_id=ingredient_id,
+                         amount=10)
+        for ingredient_id in context['large_ingredient_ids'][
+            :LARGE_RECIPE_SIZE])
+    recipe.tags.set(context['tag_ids'])
+    Cart.objects.create(user=context['user'], recipe=recipe)
+    context['large_recipe_id'] = recipe.id
+
+
+def _large_recipe_text_payload(context):
+    """Исправление описания, состав рецепта прежний."""
+    return {
+        'name': 'Большой рецепт бенчмарка',
+        'text': 'Исправленное описание',
+        'cooking_time': 10,
+        'tags': context['tag_ids'],
+        'ingredients': [
+            {'id': ingredient_id, 'amount': 10}
+            for ingredient_id in context['large_ingredient_ids'][
+                :LARGE_RECIPE_SIZE]],
+    }
+
+
+def _large_recipe_ingredients_payload(context):
+    """Замена LARGE_RECIPE_REPLACED ингредиентов и изменение количества
+    LARGE_RECIPE_CHANGED ингредиентов."""
+    ingredient_ids = context['large_ingredient_ids'][
+        LARGE_RECIPE_REPLACED:LARGE_RECIPE_SIZE + LARGE_RECIPE_REPLACED]
+    return dict(_large_recipe_text_payload(context), ingredients=[
+        {'id': ingredient_id,
+         'amount': 20 if index < LARGE_RECIPE_CHANGED else 10}
+        for index, ingredient_id in enumerate(ingredient_ids)])
+
+
+def _large_recipe_path(context):
+    return f'/api/recipes/{context["large_recipe_id"]}/'
+
+
+def _created_recipe_path(context):
+    return f'/api/recipes/{context["created_recipe_id"]}/'
+
+
+SCENARIOS = (
+    Scenario('auth-login', 'post', '/api/auth/token/login/',
+             queries=3, ms=1000, auth=False, repeat=False,
+             data=lambda context: {'email': context['user'].email,
+                                   'password': SYNTHETIC_PASSWORD}),
+    Scenario('tags-list', 'get', '/api/tags/', queries=1, ms=50,
+             auth=False),
+    Scenario('tags-detail', 'get',
+             lambda context: f'/api/tags/{context["tag_ids"][0]}/',
+             queries=1, ms=50, auth=False),
+    Scenario('ingredients-list', 'get',
+             f'/api/ingredients/?name={SYNTHETIC_PREFIX}',
+             queries=0, ms=100, auth=False),
+    Scenario('ingredients-detail', 'get',
+             lambda context: (
+                 f'/api/ingredients/{context["ingredient_ids"][0]}/'),
+             queries=1, ms=50, auth=False),
+    # Без кеша: запросы queryset, запрос версий каталога и запрос копий
+    # изображений и флагов пользователя поверх страницы.
+    Scenario('recipes-list-anonymous', 'get', '/api/recipes/',
+             queries=6, ms=200, auth=False, paginated=True, cold=True),
+    Scenario('recipes-list', 'get', '/api/recipes/',
+             queries=7, ms=200, paginated=True, cold=True),
+    Scenario('recipes-list-cursor', 'get', '/api/recipes/?pagination=cursor',
+             queries=6, ms=200, paginated=True, cold=True),
+    Scenario('recipes-list-anonymous-cached', 'get', '/api/recipes/',
+             queries=2, ms=100, auth=False, paginated=True),
+    Scenario('recipes-list-cached', 'get', '/api/recipes/',
+             queries=3, ms=100, paginated=True),
+    Scenario('recipes-list-cursor-cached', 'get',
+             '/api/recipes/?pagination=cursor',
+             queries=3, ms=100, paginated=True),
+    Scenario('recipes-list-favorited', 'get',
+             '/api/recipes/?is_favorited=1', queries=6, ms=200,
+             paginated=True),
+    Scenario('recipes-list-in-cart', 'get',
+             '/api/recipes/?is_in_shopping_cart=1', queries=6, ms=200,
+             paginated=True),
+    Scenario('recipes-list-tags', 'get',
+             lambda context: (
+                 f'/api/recipes/?tags={context["tag_slugs"][0]}'
+                 f'&tags={context["tag_slugs"][1]}'),
+             queries=6, ms=200, paginated=True),
+    Scenario('recipes-search', 'get',
+             f'/api/recipes/?search={SYNTHETIC_PREFIX}&search_mode=fulltext',
+             queries=6, ms=200, paginated=True),
+    Scenario('recipes-feed', 'get', '/api/recipes/feed/',
+             queries=7, ms=200, paginated=True),
+    Scenario('recipes-detail', 'get',
+             lambda context: f'/api/recipes/{context["recipe"].id}/',
+             queries=5, ms=100),
+    Scenario('recipes-similar', 'get',
+             lambda context: f'/api/recipes/{context["recipe"].id}/similar/',
+             queries=9, ms=100),
+    Scenario('recipes-create', 'post', '/api/recipes/',
+             queries=19, ms=300, repeat=False, status=201,
+             data=_recipe_payload),
+    Scenario('recipes-partial-update', 'patch', _created_recipe_path,
+             queries=18, ms=300, repeat=False, data=_recipe_payload),
+    Scenario('recipes-update-large-text', 'patch', _large_recipe_path,
+             queries=18, ms=300, repeat=False,
+             data=_large_recipe_text_payload, prepare=_create_large_recipe),
+    Scenario('recipes-update-large-ingredients', 'patch',
+             _large_recipe_path, queries=25, ms=300, repeat=False,
+             data=_large_recipe_ingredients_payload,
+             prepare=_create_large_recipe),
+    Scenario('recipes-destroy', 'delete', _created_recipe_path,
+             queries=17, ms=200, repeat=False, status=204),
+    Scenario('recipes-favorite-add', 'post',
+             lambda context: (
+                 f'/api/recipes/{context["recipe"].id}/favorite/'),
+             queries=5, ms=100, repeat=False, status=201,
+             prepare=_unfavorite),
+    Scenario('recipes-favorite-remove', 'delete',
+             lambda context: (
+                 f'/api/recipes/{context["recipe"].id}/favorite/'),
+             queries=4, ms=100, repeat=False, status=204),
+    Scenario('recipes-shopping-cart-add', 'post',
+             lambda context: (
+                 f'/api/recipes/{context["recipe"].id}/shopping_cart/'),
+             queries=7, ms=100, repeat=False, status=201,
+             prepare=_remove_from_cart),
+    Scenario('recipes-shopping-cart-remove', 'delete',
+             lambda context: (
+                 f'/api/recipes/{context["recipe"].id}/shopping_cart/'),
+             queries=6, ms=100, repeat=False, status=204),
+    Scenario('recipes-favorite-bulk-add', 'post', '/api/recipes/favorite/',
+             queries=5, ms=100, repeat=False, data=_bulk_payload,
+             prepare=_unfavorite_bulk),
+    Scenario('recipes-favorite-bulk-remove', 'delete',
+             '/api/recipes/favorite/', queries=5, ms=100, repeat=False,
+             data=_bulk_payload),
+    Scenario('recipes-shopping-cart-bulk-add', 'post',
+             '/api/recipes/shopping_cart/', queries=7, ms=100,
+             repeat=False, data=_bulk_payload,
+             prepare=_remove_from_cart_bulk),
+    Scenario('recipes-shopping-cart-bulk-remove', 'delete',
+             '/api/recipes/shopping_cart/', queries=7, ms=100,
+             repeat=False, data=_bulk_payload),
+    Scenario('recipes-download-shopping-cart', 'get',
+             '/api/recipes/download_shopping_cart/', queries=2, ms=300),
+    Scenario('recipes-download-shopping-cart-csv', 'get',
+             '/api/recipes/download_shopping_cart/?format=csv',
+             queries=2, ms=300),
+    Scenario('users-list-anonymous', 'get', '/api/users/',
+             queries=2, ms=100, auth=False, paginated=True),
+    Scenario('users-list', 'get', '/api/users/',
+             queries=3, ms=100, paginated=True),
+    Scenario('users-detail', 'get',
+             lambda context: f'/api/users/{context["author"].id}/',
+             queries=2, ms=50),
+    Scenario('users-me', 'get', '/api/users/me/', queries=2, ms=50),
+    Scenario('users-subscriptions', 'get',
+             '/api/users/subscriptions/?recipes_limit=3',
+             queries=4, ms=300, paginated=True),
+    Scenario('users-subscriptions-cursor', 'get',
+             '/api/users/subscriptions/?recipes_limit=3&pagination=cursor',
+             queries=3, ms=300, paginated=True),
+    Scenario('users-subscribe', 'post',
+             lambda context: (
+                 f'/api/users/{context["author"].id}/subscribe/'),
+             queries=8, ms=100, repeat=False, status=201,
+             prepare=_unfollow),
+    Scenario('users-unsubscribe', 'delete',
+             lambda context: (
+                 f'/api/users/{context["author"].id}/subscribe/'),
+             queries=6, ms=100, repeat=False, status=204),
+    Scenario('auth-logout', 'post', '/api/auth/token/logout/',
+             queries=3, ms=100, repeat=False, status=204),
+)
+
+
+class Command(BaseCommand):
+    help = ('Бенчмарк API: число SQL-запросов и время ответа каждого '
+            'маршрута на синтетических данных разного размера.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales', nargs='+', type=int, default=[1, 4],
+            help='Множители размера синтетического набора данных.')
+        parser.add_argument(
+            '--page-sizes', nargs='+', type=int, default=[6, 30],
+            help='Значения параметра limit для списков.')
+        parser.add_argument(
+            '--users', type=int, default=20,
+            help='Число пользователей при множителе 1.')
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Число повторов GET-запросов после одного прогревочного, '
+                 'берется медиана времени.')
+        parser.add_argument(
+            '--time-growth', type=float, default=3.0,
+            help='Допустимый рост времени ответа при росте данных.')
+        parser.add_argument(
+            '--strict-time', action='store_true',
+            help='Завершаться ошибкой и при превышении бюджетов времени, '
+                 'по умолчанию они только выводятся предупреждениями.')
+        parser.add_argument(
+            '--output', help='Путь для отчета в формате JSON.')
+        parser.add_argument(
+            '--no-fail', action='store_true',
+            help='Не завершаться ошибкой при превышении бюджетов.')
+
+    def handle(self, *args, **options):
+        results = []
+        with benchmark_environment():
+            for scale in options['scales']:
+                results.extend(self.run_scale(scale, options))
+
+        violations, warnings = self.check_budgets(
+            results, options['time_growth'])
+        if options['strict_time']:
+            violations, warnings = violations + warnings, []
+        report = {
+            'meta': {
+                'database': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'scales': options['scales'],
+                'page_sizes': options['page_sizes'],
+                'users': options['users'],
+                'repeat': options['repeat'],
+            },
+            'results': results,
+            'violations': violations,
+            'warnings': warnings,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2,
+                          sort_keys=True)
+
+        for result in results:
+            self.stdout.write(
+                '{endpoint:<32} scale={scale:<3} limit={page_size!s:<5} '
+                'queries={queries:<4} ms={ms:.1f}'.format(**result))
+        for warning in warnings:
+            self.stderr.write(self.style.WARNING(warning))
+        for violation in violations:
+            self.stderr.write(violation)
+        if not violations:
+            self.stdout.write(self.style.SUCCESS('Бюджеты соблюдены.'))
+        elif not options['no_fail']:
+            raise CommandError(
+                f'Превышены бюджеты: {len(violations)}.')
+
+    def run_scale(self, scale, options):
+        call_command('flush', interactive=False, verbosity=0)
+        # Версии справочников после flush начинаются заново, и ключи кеша
+        # и версия индекса ингредиентов совпали бы с данными предыдущего
+        # масштаба.
+        cache.clear()
+        ingredient_index.invalidate()
+        base = options['users']
+        seed_dataset(users=base * scale, ingredients=50 * scale,
+                     follows_per_user=5 * scale,
+                     favorites_per_user=5 * scale,
+                     carts_per_user=5 * scale)
+        context = self.build_context()
+        results = []
+        for scenario in SCENARIOS:
+            page_sizes = (options['page_sizes'] if scenario.paginated
+                          else [None])
+            for page_size in page_sizes:
+                result = self.run_scenario(scenario, context, page_size,
+                                           options['repeat'])
+                result['scale'] = scale
+                results.append(result)
+        return results
+
+    def build_context(self):
+        user = User.objects.get(username=f'{SYNTHETIC_PREFIX}0')
+        followed = Follow.objects.filter(user=user).values('following')
+        author = User.objects.exclude(pk=user.pk).exclude(
+            pk__in=followed).first()
+        if author is None:
+            author = User.objects.exclude(pk=user.pk).first()
+        tags = list(Tag.objects.values_list('id', 'slug')[:2])
+        return {
+            'user': user,
+            'token': Token.objects.create(user=user).key,
+            'author': author,
+            'recipe': Recipe.objects.exclude(author=user).first(),
+            'recipe_ids': list(Recipe.objects.exclude(author=user).values_list(
+                'id', flat=True)[:BULK_SIZE]),
+            'tag_ids': [tag_id for tag_id, _ in tags],
+            'tag_slugs': [slug for _, slug in tags],
+            'large_ingredient_ids': list(Ingredient.objects.values_list(
+                'id', flat=True)[:LARGE_RECIPE_SIZE + LARGE_RECIPE_REPLACED]),
+            'ingredient_ids': list(
+                user.recipes.first().ingredients.values_list(
+                    'id', flat=True)),
+        }
+
+    def run_scenario(self, scenario, context, page_size, repeat):
+        client = APIClient()
+        if scenario.auth:
+            client.credentials(HTTP_AUTHORIZATION=f'Token {context["token"]}')
+        timings, counts = [], []
+        # Первый из повторяемых запросов прогревочный: кеши справочников,
+        # соединение с БД и импорт модулей в замер не входят.
+        runs = repeat + 1 if scenario.repeat else 1
+        for run in range(runs):
+            if scenario.prepare:
+                scenario.prepare(context)
+            if scenario.cold:
+                bump_version(RECIPES)
+            request = getattr(client, scenario.method)
+            path = scenario.build_path(context, page_size)
+            data = scenario.build_data(context)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = request(path, data, format='json')
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = (time.perf_counter() - started) * 1000
+            if not scenario.repeat or run:
+                timings.append(elapsed)
+                counts.append(len(queries))
+            if response.status_code != scenario.status:
+                raise CommandError(
+                    f'{scenario.name}: {path} вернул '
+                    f'{response.status_code} вместо {scenario.status}.')
+        if scenario.name == 'recipes-create':
+            context['created_recipe_id'] = response.data['id']
+        if scenario.name == 'auth-logout':
+            context['token'] = Token.objects.create(user=context['user']).key
+        return {
+            'endpoint': scenario.name,
+            'method': scenario.method.upper(),
+            'page_size': page_size,
+            'queries': max(counts),
+            'ms': round(statistics.median(timings), 3),
+            'budget_queries': scenario.queries,
+            'budget_ms': scenario.ms,
+            'repeated': scenario.repeat,
+        }
+
+    def check_budgets(self, results, time_growth):
+        """Нарушения бюджетов запросов и предупреждения о времени ответа:
+        время зависит от машины и ее загрузки, число запросов - нет."""
+        violations, warnings = [], []
+        by_endpoint = {}
+        for result in results:
+            by_endpoint.setdefault(result['endpoint'], []).append(result)
+            if result['queries'] > result['budget_queries']:
+                violations.append(
+                    '{endpoint} (scale={scale}, limit={page_size}): '
+                    '{queries} запросов при бюджете '
+                    '{budget_queries}.'.format(**result))
+            if result['ms'] > result['budget_ms']:
+                warnings.append(
+                    '{endpoint} (scale={scale}, limit={page_size}): '
+                    '{ms:.1f} мс при бюджете {budget_ms} мс.'.format(
+                        **result))
+        for endpoint, runs in by_endpoint.items():
+            counts = {run['queries'] for run in runs}
+            if len(counts) > 1:
+                violations.append(
+                    f'{endpoint}: число запросов зависит от объема данных '
+                    f'или размера страницы: {sorted(counts)}.')
+            if not runs[0]['repeated']:
+                # Одиночные замеры изменяющих запросов слишком шумные.
+                continue
+            by_page_size = {}
+            for run in runs:
+                by_page_size.setdefault(run['page_size'], []).append(
+                    run['ms'])
+            for page_size, timings in by_page_size.items():
+                if min(timings) and (max(timings) / min(timings)
+                                     > time_growth):
+                    warnings.append(
+                        f'{endpoint} (limit={page_size}): время ответа '
+                        f'выросло с {min(timings):.1f} до '
+                        f'{max(timings):.1f} мс.')
+        return violations, warnings
@@ -0,0 +1,232 @@
+import json
+import re
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+from rest_framework.test import APIClient
+
+from api.benchmarks import CACHES, benchmark_environment
+from recipes.models import Recipe, Tag
+from recipes.synthetic import SYNTHETIC_PREFIX, generate_dataset
+from users.models import User
+
+# Маршруты, запросы которых проверяются: имя, путь, нужна ли авторизация.
+ROUTES = (
+    ('recipes-list-anonymous', '/api/recipes/', False),
+    ('recipes-list', '/api/recipes/', True),
+    ('recipes-list-cursor', '/api/recipes/?pagination=cursor', False),
+    ('recipes-list-popular', '/api/recipes/?ordering=-favorites_count',
+     False),
+    ('recipes-list-favorited', '/api/recipes/?is_favorited=1', True),
+    ('recipes-list-in-cart', '/api/recipes/?is_in_shopping_cart=1', True),
+    ('recipes-list-tag', '/api/recipes/?tags={tag}', False),
+    ('recipes-list-tags-all', '/api/recipes/?tags={tag}&tags={tag2}'
+     '&tags_mode=all', False),
+    ('recipes-list-author', '/api/recipes/?author={author}', False),
+    ('recipes-feed', '/api/recipes/feed/', True),
+    ('recipes-detail', '/api/recipes/{recipe}/', True),
+    ('recipes-similar', '/api/recipes/{recipe}/similar/', True),
+    ('users-detail', '/api/users/{author}/', True),
+    ('users-subscriptions', '/api/users/subscriptions/?recipes_limit=3',
+     True),
+    ('recipes-download-shopping-cart',
+     '/api/recipes/download_shopping_cart/?format=csv', True),
+)
+# Псевдонимы таблиц в подзапросах Django: "recipes_cart" U0.
+TABLE_ALIAS = re.compile(r'"(\w+)" (?:AS )?"?([A-Z]\d+)\b')
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?(.*)$')
+
+
+def sequential_scans(sql, params):
+    """Таблицы, которые план запроса читает целиком: {таблица: есть ли
+    условие}. Без условия таблица читается вся по смыслу запроса (COUNT
+    без фильтра, хеш-соединение), с условием - не хватает индекса. SQLite
+    не сообщает условий, его SCAN без индекса считается с условием."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            nodes, tables = [plan[0]['Plan']], {}
+            while nodes:
+                node = nodes.pop()
+                if node['Node Type'] == 'Seq Scan':
+                    table = node['Relation Name']
+                    tables[table] = tables.get(table) or 'Filter' in node
+                nodes.extend(node.get('Plans', ()))
+            return tables
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        plan = cursor.fetchall()
+        aliases = {alias: table for table, alias in TABLE_ALIAS.findall(sql)}
+        existing = set(connection.introspection.table_names(cursor))
+        tables = {}
+        for *_, detail in plan:
+            match = SQLITE_SCAN.match(detail)
+            # SCAN ... USING INDEX - чтение индекса по порядку, не таблицы,
+            # SCAN subquery - результата подзапроса.
+            if match and 'USING' not in match.group(3):
+                name = match.group(2) or match.group(1)
+                if aliases.get(name, name) in existing:
+                    tables[aliases.get(name, name)] = True
+        return tables
+
+
+def table_rows(table):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [table])
+            rows = cursor.fetchone()[0]
+            # -1 - таблица еще не анализировалась.
+            if rows >= 0:
+                return int(rows)
+        cursor.execute(
+            f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+        return cursor.fetchone()[0]
+
+
+@contextmanager
+def current_database():
+    """Рабочая БД, но отдельный кеш: страницы списка рецептов из кеша не
+    выполняли бы запросов."""
+    setup_test_environment()
+    try:
+        with override_settings(CACHES=CACHES):
+            yield
+    finally:
+        teardown_test_environment()
+
+
+class Command(BaseCommand):
+    help = ('EXPLAIN SQL-запросов основных маршрутов API. Завершается '
+            'ошибкой, если план последовательно читает таблицу больше '
+            '--min-rows строк с условием, которое мог бы обслужить индекс.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--generate', type=int, metavar='ПОЛЬЗОВАТЕЛИ',
+            help='Сгенерировать данные для этого числа пользователей во '
+                 'временной тестовой БД. Без него запросы выполняются к '
+                 'рабочей БД (только чтение).')
+        parser.add_argument(
+            '--user',
+            help='username пользователя для авторизованных маршрутов, по '
+                 'умолчанию - с наибольшим числом подписок.')
+        parser.add_argument(
+            '--min-rows', type=int, default=1000,
+            help='С какого числа строк таблица считается большой.')
+        parser.add_argument(
+            '--strict', action='store_true',
+            help='Ошибка и при чтении большой таблицы целиком без условия.')
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help='Выводить SQL всех проверенных запросов.')
+        parser.add_argument(
+            '--output', help='Путь для отчета в формате JSON.')
+
+    def handle(self, *args, **options):
+        environment = (benchmark_environment()
+                       if options['generate'] is not None
+                       else current_database())
+        with environment:
+            if options['generate'] is not None:
+                generate_dataset(users=options['generate'])
+                if connection.vendor == 'postgresql':
+                    with connection.cursor() as cursor:
+                        cursor.execute('ANALYZE')
+            report = self.explain_routes(options)
+
+        failures, warnings = [], []
+        for route in report:
+            for query in route['queries']:
+                for scan in query['scans']:
+                    if scan['rows'] < options['min_rows']:
+                        continue
+                    message = (f'{route["name"]}: {scan["table"]} '
+                               f'({scan["rows"]} строк)\n  {query["sql"]}')
+                    if scan['filtered'] or options['strict']:
+                        failures.append(message)
+                    else:
+                        warnings.append(message)
+                if options['verbose_plans']:
+                    self.stdout.write(f'{route["name"]}: {query["sql"]}')
+            self.stdout.write(
+                f'{route["name"]:<32}{route["status"]:>5}'
+                f'{len(route["queries"]):>4} запросов')
+        if warnings:
+            self.stdout.write(self.style.WARNING(
+                'Чтение больших таблиц целиком без условия:\n'
+                + '\n'.join(warnings)))
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({'database': connection.vendor,
+                           'min_rows': options['min_rows'],
+                           'strict': options['strict'],
+                           'routes': report}, f, indent=2, sort_keys=True,
+                          ensure_ascii=False)
+        if failures:
+            raise CommandError(
+                'Последовательное чтение больших таблиц:\n'
+                + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS(
+            'Последовательного чтения больших таблиц нет.'))
+
+    def get_context(self, username):
+        users = User.objects.all()
+        if username:
+            user = users.filter(username=username).first()
+        else:
+            user = users.annotate(follows=Count('follower')).order_by(
+                '-follows', 'pk').first()
+        recipe = Recipe.objects.order_by('-favorites_count', 'pk').first()
+        tags = list(Tag.objects.annotate(
+            recipes=Count('recipetag')).order_by('-recipes', 'pk')[:2])
+        author = users.order_by('-recipes_count', 'pk').first()
+        if user is None or recipe is None or not tags:
+            raise CommandError(
+                'Нет пользователя, рецептов или тегов. Сгенерируйте данные: '
+                f'generate_dataset или --generate (префикс '
+                f'{SYNTHETIC_PREFIX}).')
+        return user, {'recipe': recipe.pk, 'tag': tags[0].slug,
+                      'tag2': tags[-1].slug, 'author': author.pk}
+
+    def explain_routes(self, options):
+        user, context = self.get_context(options['user'])
+        rows = {}
+        report = []
+        for name, path, auth in ROUTES:
+            client = APIClient()
+            if auth:
+                client.force_authenticate(user)
+            executed = []
+
+            def collect(execute, sql, params, many, context):
+                if not many and sql.lstrip().upper().startswith('SELECT'):
+                    executed.append((sql, tuple(params or ())))
+                return execute(sql, params, many, context)
+
+            cache.clear()
+            with connection.execute_wrapper(collect):
+                response = client.get(path.format(**context))
+                if response.streaming:
+                    # Запросы потоковой выгрузки выполняются при чтении.
+                    b''.join(response.streaming_content)
+            queries = []
+            for sql, params in dict.fromkeys(executed):
+                scans = []
+                for table, filtered in sequential_scans(sql, params).items():
+                    if table not in rows:
+                        rows[table] = table_rows(table)
+                    scans.append({'table': table, 'rows': rows[table],
+                                  'filtered': filtered})
+                queries.append({'sql': sql, 'scans': scans})
+            report.append({'name': name, 'status': response.status_code,
+                           'queries': queries})
+        return report
@@ -0,0 +1,60 @@
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from api.benchmarks import benchmark_environment
+from recipes.ingredient_index import ingredient_index
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = ('Микробенчмарк автодополнения ингредиентов: индекс в памяти '
+            'против запроса istartswith через ORM.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queries', type=int, default=2000,
+            help='Число поисковых запросов.')
+
+    def handle(self, *args, **options):
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+        with benchmark_environment():
+            call_command('data_import', stdout=self.stdout)
+            names = list(Ingredient.objects.values_list('name', flat=True))
+            rnd = random.Random(0)
+            prefixes = [
+                name[:rnd.randint(1, 4)]
+                for name in rnd.choices(names, k=options['queries'])]
+
+            started = time.perf_counter()
+            ingredient_index.build()
+            build_ms = (time.perf_counter() - started) * 1000
+
+            orm = self.measure(
+                lambda prefix: list(Ingredient.objects.filter(
+                    name__istartswith=prefix).values(
+                        'id', 'name', 'measurement_unit')[:limit]),
+                prefixes)
+            index = self.measure(
+                lambda prefix: ingredient_index.search(prefix, limit),
+                prefixes)
+
+        self.stdout.write(f'Ингредиентов: {len(names)}, '
+                          f'построение индекса: {build_ms:.1f} мс')
+        for label, timings in (('orm', orm), ('index', index)):
+            timings.sort()
+            self.stdout.write(
+                f'{label:<6} median={statistics.median(timings):.1f} мкс '
+                f'p99={timings[int(len(timings) * 0.99)]:.1f} мкс')
+
+    def measure(self, search, prefixes):
+        timings = []
+        for prefix in prefixes:
+            started = time.perf_counter()
+            search(prefix)
+            timings.append((time.perf_counter() - started) * 1_000_000)
+        return timings
@@ -0,0 +1,172 @@
+import json
+import platform
+from contextlib import nullcontext
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.benchmarks import benchmark_environment
+from api.load import (ENDPOINTS, HTTPTransport, WSGITransport, percentile,
+                      prepare_context, run_load)
+from recipes.synthetic import generate_dataset
+
+PERCENTILES = (50, 95, 99)
+
+
+def parse_mix(values):
+    """Веса из аргументов вида имя=вес."""
+    names = {endpoint.name for endpoint in ENDPOINTS}
+    weights = {}
+    for value in values:
+        name, _, weight = value.partition('=')
+        if name not in names:
+            raise CommandError(f'Неизвестный запрос: {name}.')
+        try:
+            weights[name] = float(weight)
+        except ValueError:
+            raise CommandError(f'Неверный вес: {value}.')
+        if weights[name] < 0:
+            raise CommandError(f'Вес не может быть отрицательным: {value}.')
+    return weights
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест: смесь запросов к API в нескольких потоках '
+            'к api_foodgram.wsgi в этом процессе или к серверу по --url. '
+            'Выводит пропускную способность и p50/p95/p99 по каждому '
+            'запросу. Данные - из generate_dataset.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            help='Адрес сервера, например http://127.0.0.1:8000. Без него '
+                 'запросы выполняются в этом процессе.')
+        parser.add_argument(
+            '--concurrency', type=int, default=8,
+            help='Число одновременных клиентов (потоков).')
+        parser.add_argument(
+            '--duration', type=float, default=30,
+            help='Длительность замера, с.')
+        parser.add_argument(
+            '--warmup', type=float, default=5,
+            help='Прогрев перед замером, с.')
+        parser.add_argument(
+            '--users', type=int, default=20,
+            help='Сколько синтетических пользователей выполняют запросы.')
+        parser.add_argument(
+            '--mix', action='append', default=[], metavar='ИМЯ=ВЕС',
+            help='Вес запроса в смеси, 0 - исключить. Можно указать '
+                 'несколько раз.')
+        parser.add_argument(
+            '--generate', type=int, metavar='ПОЛЬЗОВАТЕЛИ',
+            help='Сгенерировать данные для этого числа пользователей во '
+                 'временной тестовой БД, только без --url. Тестовая БД '
+                 'SQLite в памяти блокирует таблицы при одновременной '
+                 'записи, запросы на запись будут с ошибками.')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Начальное значение генератора случайных чисел.')
+        parser.add_argument(
+            '--timeout', type=float, default=30,
+            help='Таймаут запроса по HTTP, с.')
+        parser.add_argument(
+            '--output', help='Путь для отчета в формате JSON.')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['users'] < 1:
+            raise CommandError(
+                '--concurrency и --users должны быть положительными.')
+        if options['duration'] <= 0 or options['warmup'] < 0:
+            raise CommandError('Неверная длительность замера или прогрева.')
+        if options['generate'] is not None and options['url']:
+            raise CommandError('--generate работает только без --url.')
+        weights = parse_mix(options['mix'])
+        for endpoint in ENDPOINTS:
+            endpoint.weight = weights.get(endpoint.name, endpoint.weight)
+        endpoints = [endpoint for endpoint in ENDPOINTS if endpoint.weight]
+        if not endpoints:
+            raise CommandError('Смесь запросов пуста.')
+
+        environment = (benchmark_environment()
+                       if options['generate'] is not None else nullcontext())
+        with environment:
+            try:
+                if options['generate'] is not None:
+                    generate_dataset(
+                        users=max(options['generate'], options['users']),
+                        seed=options['seed'])
+                if options['url']:
+                    transport = HTTPTransport(options['url'],
+                                              options['timeout'])
+                else:
+                    from api_foodgram.wsgi import application
+                    transport = WSGITransport(application)
+                context = prepare_context(transport, options['users'],
+                                          options['seed'])
+                self.stdout.write(
+                    f'Клиентов: {options["concurrency"]}, прогрев '
+                    f'{options["warmup"]} с, замер {options["duration"]} с.')
+                results, elapsed = run_load(
+                    transport, endpoints, context, options['concurrency'],
+                    options['duration'], options['warmup'], options['seed'])
+            except (OSError, ValueError) as error:
+                raise CommandError(error)
+
+        report = self.build_report(results, elapsed)
+        self.print_report(report)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({
+                    'environment': {
+                        'python': platform.python_version(),
+                        'django': django.get_version(),
+                        'database': (connection.vendor if not options['url']
+                                     else None),
+                        'target': options['url'] or 'wsgi',
+                    },
+                    'options': {key: options[key] for key in (
+                        'concurrency', 'duration', 'warmup', 'users',
+                        'generate', 'seed')},
+                    'mix': {endpoint.name: endpoint.weight
+                            for endpoint in endpoints},
+                    'results': report,
+                }, f, indent=2, sort_keys=True)
+
+    def build_report(self, results, elapsed):
+        report = []
+        total, total_errors = [], 0
+        for name, (latencies, errors) in results.items():
+            report.append(self.summarize(name, latencies, errors, elapsed))
+            total.extend(latencies)
+            total_errors += errors
+        total.sort()
+        report.append(self.summarize('total', total, total_errors, elapsed))
+        return report
+
+    def summarize(self, name, latencies, errors, elapsed):
+        summary = {
+            'name': name,
+            'requests': len(latencies),
+            'errors': errors,
+            'rps': round(len(latencies) / elapsed, 1),
+        }
+        for share in PERCENTILES:
+            value = percentile(latencies, share)
+            summary[f'p{share}_ms'] = (round(value * 1000, 1)
+                                       if value is not None else None)
+        return summary
+
+    def print_report(self, report):
+        self.stdout.write(
+            f'{"запрос":<32}{"запросов":>9}{"ошибок":>8}{"rps":>8}'
+            + ''.join(f'{f"p{share}, мс":>10}' for share in PERCENTILES))
+        for row in report:
+            self.stdout.write(
+                f'{row["name"]:<32}{row["requests"]:>9}{row["errors"]:>8}'
+                f'{row["rps"]:>8}' + ''.join(
+                    f'{row[f"p{share}_ms"] or "-":>10}'
+                    for share in PERCENTILES))
+        if report[-1]['errors']:
+            self.stderr.write(
+                f'Неожиданных ответов: {report[-1]["errors"]}.')
@@ -0,0 +1,124 @@
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from api.benchmarks import benchmark_environment
+from api.metrics import Metrics, collect, render, write_snapshot
+from recipes.models import Recipe
+from recipes.synthetic import seed_dataset
+
+# Имена маршрутов, методы и статусы для наполнения метрик.
+VIEWS = [f'view-{index}' for index in range(40)]
+METHODS = ('GET', 'GET', 'GET', 'POST', 'DELETE')
+STATUSES = (200, 200, 200, 201, 204, 400, 404)
+
+
+class Command(BaseCommand):
+    help = ('Стоимость метрик: запись одного запроса, снимок процесса, '
+            'сборка /internal/metrics/ из снимков нескольких процессов и '
+            'прирост времени ответа API с METRICS_ENABLED.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--observations', type=int, default=200000,
+            help='Число записей для замера observe.')
+        parser.add_argument(
+            '--processes', type=int, default=8,
+            help='Число снимков процессов для сборки метрик.')
+        parser.add_argument(
+            '--requests', type=int, default=500,
+            help='Число запросов к API с метриками и без них.')
+        parser.add_argument(
+            '--max-observe-us', type=float, default=10,
+            help='Допустимая стоимость записи одного запроса, мкс.')
+        parser.add_argument(
+            '--output', help='Путь для отчета в формате JSON.')
+
+    def handle(self, *args, **options):
+        rnd = random.Random(0)
+        calls = [
+            (rnd.choice(VIEWS), rnd.choice(METHODS), rnd.choice(STATUSES),
+             rnd.expovariate(20), rnd.randint(100, 100000),
+             rnd.expovariate(100))
+            for _ in range(min(options['observations'], 10000))]
+        metrics = Metrics()
+        # Без фонового потока записи снимков.
+        metrics.started = True
+        observe_us = self.measure_observe(
+            metrics, calls, options['observations'])
+
+        started = time.perf_counter()
+        snapshot = metrics.snapshot()
+        snapshot_ms = (time.perf_counter() - started) * 1000
+
+        with tempfile.TemporaryDirectory() as directory:
+            for pid in range(options['processes']):
+                write_snapshot(os.path.join(directory, f'{pid}.json'),
+                               snapshot)
+            started = time.perf_counter()
+            text = render(*collect(directory))
+            collect_ms = (time.perf_counter() - started) * 1000
+
+        with benchmark_environment():
+            seed_dataset(users=1, recipes_per_user=5)
+            disabled, enabled = self.measure_requests(options['requests'])
+
+        report = {
+            'observe_us': round(observe_us, 2),
+            'snapshot_ms': round(snapshot_ms, 2),
+            'collect_ms': round(collect_ms, 2),
+            'series': len(metrics.requests),
+            'processes': options['processes'],
+            'exposition_kb': round(len(text.encode()) / 1024, 1),
+            'request_ms': {'disabled': round(disabled, 3),
+                           'enabled': round(enabled, 3)},
+        }
+        self.stdout.write(
+            f'observe: {report["observe_us"]} мкс на запрос\n'
+            f'снимок процесса ({report["series"]} серий счетчика): '
+            f'{report["snapshot_ms"]} мс\n'
+            f'сборка метрик {options["processes"]} процессов: '
+            f'{report["collect_ms"]} мс, {report["exposition_kb"]} КБ\n'
+            f'GET /api/recipes/{{id}}/, медиана: без метрик {disabled:.3f} '
+            f'мс, с метриками {enabled:.3f} мс')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+        if observe_us > options['max_observe_us']:
+            raise CommandError(
+                f'Запись запроса {observe_us:.2f} мкс, допустимо '
+                f'{options["max_observe_us"]} мкс.')
+        self.stdout.write(self.style.SUCCESS('Бюджет соблюден.'))
+
+    def measure_observe(self, metrics, calls, observations):
+        """Лучшее из пяти повторов среднее время observe, мкс."""
+        results = []
+        for _ in range(5):
+            started = time.perf_counter()
+            for index in range(observations):
+                metrics.observe(*calls[index % len(calls)])
+            results.append((time.perf_counter() - started) / observations)
+        return min(results) * 1_000_000
+
+    def measure_requests(self, requests):
+        """Медианы времени ответа без метрик и с ними, мс. Запросы
+        чередуются, чтобы прогрев и фон влияли на оба варианта одинаково."""
+        path = f'/api/recipes/{Recipe.objects.first().pk}/'
+        client = APIClient()
+        client.get(path)
+        timings = {False: [], True: []}
+        for index in range(requests * 2):
+            enabled = bool(index % 2)
+            with override_settings(METRICS_ENABLED=enabled):
+                started = time.perf_counter()
+                client.get(path)
+                timings[enabled].append(time.perf_counter() - started)
+        return (statistics.median(timings[False]) * 1000,
+                statistics.median(timings[True]) * 1000)
@@ -0,0 +1,85 @@
+import json
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIClient
+
+from api.benchmarks import benchmark_environment
+from api.renderers import SHOPPING_LIST_RENDERERS
+from recipes.models import Cart, Recipe
+from recipes.shopping_cart import rebuild_shopping_lists
+from recipes.synthetic import SYNTHETIC_PREFIX, seed_dataset
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Сравнение форматов выгрузки списка покупок: скорость отдачи '
+            'и пиковое потребление памяти на большой корзине.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, default=200,
+            help='Число рецептов в корзине.')
+        parser.add_argument(
+            '--ingredients', type=int, default=2000,
+            help='Размер справочника ингредиентов.')
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=30,
+            help='Число ингредиентов в рецепте.')
+        parser.add_argument(
+            '--output', help='Путь для отчета в формате JSON.')
+
+    def handle(self, *args, **options):
+        with benchmark_environment():
+            seed_dataset(users=2, ingredients=options['ingredients'],
+                         recipes_per_user=options['recipes'],
+                         ingredients_per_recipe=options[
+                             'ingredients_per_recipe'],
+                         follows_per_user=0, favorites_per_user=0,
+                         carts_per_user=0)
+            user = User.objects.get(username=f'{SYNTHETIC_PREFIX}0')
+            Cart.objects.bulk_create(
+                Cart(user=user, recipe_id=recipe_id)
+                for recipe_id in Recipe.objects.values_list('id', flat=True))
+            rebuild_shopping_lists([user.pk])
+            client = APIClient()
+            client.force_authenticate(user)
+            results = [self.measure(client, renderer.format)
+                       for renderer in SHOPPING_LIST_RENDERERS]
+
+        for result in results:
+            self.stdout.write(
+                '{format:<5} bytes={bytes:<9} ms={ms:<9.1f} '
+                'MB/s={mb_per_second:<8.2f} '
+                'peak_kb={peak_kb:.1f}'.format(**result))
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({'options': {
+                    key: options[key] for key in (
+                        'recipes', 'ingredients', 'ingredients_per_recipe')},
+                    'results': results}, f, indent=2, sort_keys=True)
+
+    def download(self, client, export_format):
+        response = client.get('/api/recipes/download_shopping_cart/',
+                              {'format': export_format})
+        if response.streaming:
+            return sum(len(chunk) for chunk in response.streaming_content)
+        return len(response.content)
+
+    def measure(self, client, export_format):
+        # Время и память меряются отдельно: tracemalloc замедляет код.
+        started = time.perf_counter()
+        size = self.download(client, export_format)
+        elapsed = time.perf_counter() - started
+        tracemalloc.start()
+        self.download(client, export_format)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {
+            'format': export_format,
+            'bytes': size,
+            'ms': round(elapsed * 1000, 3),
+            'mb_per_second': round(size / elapsed / 2 ** 20, 3),
+            'peak_kb': round(peak / 1024, 1),
+        }
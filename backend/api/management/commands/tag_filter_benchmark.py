@@ -0,0 +1,128 @@
+import json
+import random
+import statistics
+import time
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.http import QueryDict
+from django_filters.rest_framework import filters
+
+from api.benchmarks import benchmark_environment
+from api.filters import RecipeFilter
+from recipes.models import Recipe, Tag
+from recipes.synthetic import generate_dataset
+from users.models import User
+
+
+class JoinRecipeFilter(RecipeFilter):
+    """Прежний фильтр тегов: соединение с тегами по slug и DISTINCT,
+    conjoined - рецепты со всеми тегами."""
+
+    tags = filters.ModelMultipleChoiceFilter(
+        field_name='tags__slug', to_field_name='slug',
+        queryset=Tag.objects.all())
+
+    def __init__(self, *args, **kwargs):
+        super(RecipeFilter, self).__init__(*args, **kwargs)
+        conjoined = self.data.get('tags_mode') == 'all'
+        self.filters['tags'].conjoined = conjoined
+
+
+class Command(BaseCommand):
+    help = ('Фильтр рецептов по нескольким тегам: подзапросы IN по id '
+            'тегов против соединения по slug с DISTINCT, режимы any и all, '
+            'отдельно и вместе с is_favorited. Время - страница и count, '
+            'как при постраничном ответе.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=2000,
+            help='Число пользователей синтетических данных.')
+        parser.add_argument(
+            '--recipes-per-user', type=int, default=5,
+            help='Среднее число рецептов пользователя.')
+        parser.add_argument(
+            '--repeat', type=int, default=30,
+            help='Число замеров каждого случая.')
+        parser.add_argument(
+            '--output', help='Путь для отчета в формате JSON.')
+
+    def handle(self, *args, **options):
+        report = []
+        with benchmark_environment():
+            generate_dataset(users=options['users'],
+                             recipes_per_user=options['recipes_per_user'])
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+            # Пользователь с наибольшим избранным.
+            user = User.objects.annotate(
+                favorites=Count('users_favorits_recipe')).order_by(
+                    '-favorites', 'pk').first()
+            request = SimpleNamespace(user=user)
+            slugs = list(Tag.objects.order_by('pk').values_list(
+                'slug', flat=True))
+            if len(slugs) < 3:
+                raise CommandError('Нужно не меньше трех тегов.')
+            rnd = random.Random(0)
+            for count in (1, 2, 3):
+                for mode in ('any', 'all'):
+                    for favorited in (False, True):
+                        data = QueryDict(mutable=True)
+                        data.setlist('tags', rnd.sample(slugs, count))
+                        data['tags_mode'] = mode
+                        if favorited:
+                            data['is_favorited'] = '1'
+                        report.append(self.compare(
+                            data, request, options['repeat']))
+            recipes = Recipe.objects.count()
+
+        self.stdout.write(f'Рецептов: {recipes}, БД: {connection.vendor}')
+        self.stdout.write(
+            f'{"случай":<36}{"рецептов":>9}{"join, мс":>10}'
+            f'{"in, мс":>12}{"ускорение":>11}')
+        for row in report:
+            self.stdout.write(
+                f'{row["case"]:<36}{row["count"]:>9}{row["join_ms"]:>10}'
+                f'{row["semijoin_ms"]:>12}{row["speedup"]:>11}')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({'database': connection.vendor,
+                           'recipes': recipes, 'results': report},
+                          f, indent=2, sort_keys=True)
+
+    def compare(self, data, request, repeat):
+        timings = {}
+        results = {}
+        for name, filterset_class in (('join', JoinRecipeFilter),
+                                      ('semijoin', RecipeFilter)):
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                filterset = filterset_class(
+                    data, queryset=Recipe.objects.all(), request=request)
+                queryset = filterset.qs.order_by('-pub_date', '-id')
+                page = list(queryset.values_list('id', flat=True)[
+                    :settings.PAGE_SIZE])
+                count = queryset.count()
+                samples.append(time.perf_counter() - started)
+            timings[name] = statistics.median(samples) * 1000
+            results[name] = (page, count)
+        if results['join'] != results['semijoin']:
+            raise CommandError(
+                f'Результаты фильтров различаются: {data.urlencode()}')
+        case = '{} {}{}'.format(
+            len(data.getlist('tags')), data['tags_mode'],
+            ' is_favorited' if 'is_favorited' in data else '')
+        return {
+            'case': case,
+            'query': data.urlencode(),
+            'count': results['semijoin'][1],
+            'join_ms': round(timings['join'], 2),
+            'semijoin_ms': round(timings['semijoin'], 2),
+            'speedup': round(timings['join'] / timings['semijoin'], 2),
+        }
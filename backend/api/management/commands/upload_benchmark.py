@@ -0,0 +1,121 @@
+import base64
+import json
+import multiprocessing
+import resource
+import sys
+from io import BytesIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.benchmarks import benchmark_environment
+from recipes.models import Ingredient, Tag
+from recipes.synthetic import SYNTHETIC_PREFIX, seed_dataset
+from users.models import User
+
+
+def max_rss_kb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В macOS ru_maxrss в байтах, в Linux - в килобайтах.
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def upload(connection, user, mode, payload):
+    """Загрузка в дочернем процессе: прирост пикового RSS над RSS на момент
+    fork (пик дочернего процесса начинается с него)."""
+    baseline = max_rss_kb()
+    client = APIClient()
+    client.force_authenticate(user)
+    if mode == 'multipart':
+        data = dict(payload, image=SimpleUploadedFile(
+            'image.jpg', payload['image'], 'image/jpeg'))
+        response = client.post('/api/recipes/', data, format='multipart')
+    else:
+        response = client.post('/api/recipes/', payload, format='json')
+    connection.send((response.status_code, max_rss_kb() - baseline))
+    connection.close()
+
+
+class Command(BaseCommand):
+    help = ('Пиковое потребление памяти (RSS) при загрузке изображения '
+            'рецепта data URL в JSON и файлом multipart/form-data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--width', type=int, default=4000,
+            help='Ширина тестового изображения.')
+        parser.add_argument(
+            '--height', type=int, default=3000,
+            help='Высота тестового изображения.')
+        parser.add_argument(
+            '--max-rss-mb', type=float, default=100,
+            help='Допустимый прирост пикового RSS на загрузку, МБ.')
+        parser.add_argument(
+            '--output', help='Путь для отчета в формате JSON.')
+
+    def handle(self, *args, **options):
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError('Нужна поддержка fork.')
+        context = multiprocessing.get_context('fork')
+        image = self.make_image(options['width'], options['height'])
+        results = []
+        with benchmark_environment():
+            seed_dataset(users=1, recipes_per_user=0)
+            user = User.objects.get(username=f'{SYNTHETIC_PREFIX}0')
+            payload = {
+                'ingredients': [{'id': Ingredient.objects.first().id,
+                                 'amount': 1}],
+                'tags': [Tag.objects.first().id],
+                'name': 'Загрузка',
+                'text': 'Проверка памяти.',
+                'cooking_time': 1,
+            }
+            cases = (
+                ('base64', dict(payload, image='data:image/jpeg;base64,'
+                                + base64.b64encode(image).decode())),
+                ('multipart', dict(
+                    payload, ingredients=json.dumps(payload['ingredients']),
+                    tags=json.dumps(payload['tags']), image=image)),
+            )
+            for mode, data in cases:
+                # Соединения с БД не должны наследоваться дочерним процессом.
+                connections.close_all()
+                receiver, sender = context.Pipe(duplex=False)
+                process = context.Process(
+                    target=upload, args=(sender, user, mode, data))
+                process.start()
+                status, rss_kb = receiver.recv()
+                process.join()
+                results.append({'mode': mode, 'status': status,
+                                'bytes': len(image),
+                                'peak_rss_mb': round(rss_kb / 1024, 1)})
+
+        failures = []
+        for result in results:
+            self.stdout.write(
+                '{mode:<10} status={status} bytes={bytes} '
+                'peak_rss_mb={peak_rss_mb}'.format(**result))
+            if result['status'] != 201:
+                failures.append(f'{result["mode"]}: статус {result["status"]}')
+            if result['peak_rss_mb'] > options['max_rss_mb']:
+                failures.append(
+                    f'{result["mode"]}: {result["peak_rss_mb"]} МБ при '
+                    f'бюджете {options["max_rss_mb"]} МБ')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump({'options': {
+                    key: options[key] for key in (
+                        'width', 'height', 'max_rss_mb')},
+                    'results': results}, f, indent=2, sort_keys=True)
+        if failures:
+            raise CommandError('\n'.join(failures))
+
+    def make_image(self, width, height):
+        # Шум не сжимается, размер файла близок к худшему случаю.
+        image = Image.effect_noise((width, height), 64).convert('RGB')
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', quality=85)
+        return buffer.getvalue()
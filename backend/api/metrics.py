@@ -0,0 +1,248 @@
+"""Метрики запросов в формате Prometheus.
+
+Для каждого маршрута (имя URL: recipes-list, recipes-favorite,
+users-subscriptions, ...) и метода считаются запросы по статусам и
+гистограммы длительности, размера ответа и времени SQL. Время SQL есть
+только у запросов, выбранных REQUEST_PROFILING_SAMPLE_RATE, размер - только
+у непотоковых ответов.
+
+Процесс копит метрики в памяти: запись - несколько операций со словарями
+под блокировкой. Если задан METRICS_DIR, фоновый поток раз в
+METRICS_FLUSH_INTERVAL секунд сохраняет снимок процесса в файл <pid>.json
+этого каталога, а /internal/metrics/ складывает снимки всех процессов
+(воркеров gunicorn). Снимки завершенных воркеров gunicorn.conf.py
+переносит в archived.json, чтобы счетчики не уменьшались.
+"""
+import atexit
+import ipaddress
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+REQUESTS = ('foodgram_http_requests_total',
+            'Number of requests by view, method and status.')
+# Гистограммы: имя, описание, границы корзин.
+HISTOGRAMS = {
+    'duration': ('foodgram_http_request_duration_seconds',
+                 'Request duration in seconds.', DURATION_BUCKETS),
+    'size': ('foodgram_http_response_size_bytes',
+             'Response body size in bytes.', SIZE_BUCKETS),
+    'db': ('foodgram_http_db_duration_seconds',
+           'SQL time per request in seconds, sampled requests only.',
+           DURATION_BUCKETS),
+}
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+ARCHIVE = 'archived.json'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Metrics:
+    """Метрики текущего процесса. Серия гистограммы - счетчики корзин,
+    последний из них - больше всех границ (+Inf), и сумма значений."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.lock = threading.Lock()
+        self.started = False
+        self.requests = {}
+        self.histograms = {name: {} for name in HISTOGRAMS}
+
+    def start(self):
+        """Фоновая запись снимков - в каждом процессе при первом запросе."""
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        if settings.METRICS_DIR:
+            os.makedirs(settings.METRICS_DIR, exist_ok=True)
+            threading.Thread(target=self.flush_loop, name='metrics-flush',
+                             daemon=True).start()
+            atexit.register(self.flush)
+
+    def observe(self, view, method, status, duration, size=None, db=None):
+        if not self.started:
+            self.start()
+        if method not in METHODS:
+            method = 'other'
+        key = (view, method)
+        with self.lock:
+            counter = (view, method, status)
+            self.requests[counter] = self.requests.get(counter, 0) + 1
+            self._observe('duration', key, duration)
+            if size is not None:
+                self._observe('size', key, size)
+            if db is not None:
+                self._observe('db', key, db)
+
+    def _observe(self, name, key, value):
+        buckets = HISTOGRAMS[name][2]
+        series = self.histograms[name].get(key)
+        if series is None:
+            series = self.histograms[name][key] = [0] * (len(buckets) + 2)
+        series[bisect_left(buckets, value)] += 1
+        series[-1] += value
+
+    def snapshot(self):
+        with self.lock:
+            return dump(self.requests, self.histograms)
+
+    def flush(self):
+        write_snapshot(
+            os.path.join(settings.METRICS_DIR, f'{os.getpid()}.json'),
+            self.snapshot())
+
+    def flush_loop(self):
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except OSError:
+                logger.exception('Failed to write metrics snapshot.')
+
+
+metrics = Metrics()
+# Воркеры gunicorn с --preload получают копию метрик и блокировки
+# родителя, поток записи в дочерний процесс не переходит.
+os.register_at_fork(after_in_child=metrics.reset)
+
+
+def dump(requests, histograms):
+    """Снимок для JSON: ключи-кортежи разворачиваются в списки."""
+    return {
+        'requests': [[*key, value] for key, value in requests.items()],
+        'histograms': {
+            name: [[*key, list(values)] for key, values in series.items()]
+            for name, series in histograms.items()},
+    }
+
+
+def write_snapshot(path, snapshot):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+    os.replace(temporary, path)
+
+
+def read_snapshot(path):
+    """Снимок из файла, None - если файл удален или поврежден."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def merge(snapshots):
+    """Сумма снимков: ({(view, method, status): число},
+    {гистограмма: {(view, method): серия}}). Серии с другим числом корзин
+    (снимки до изменения границ) пропускаются."""
+    requests = {}
+    histograms = {name: {} for name in HISTOGRAMS}
+    for snapshot in snapshots:
+        for *key, value in snapshot.get('requests', ()):
+            key = tuple(key)
+            requests[key] = requests.get(key, 0) + value
+        for name, series in snapshot.get('histograms', {}).items():
+            if name not in histograms:
+                continue
+            size = len(HISTOGRAMS[name][2]) + 2
+            for *key, values in series:
+                if len(values) != size:
+                    continue
+                merged = histograms[name].setdefault(tuple(key), [0] * size)
+                for index, value in enumerate(values):
+                    merged[index] += value
+    return requests, histograms
+
+
+def collect(directory=None):
+    """Метрики всех процессов: снимки из directory (по умолчанию
+    METRICS_DIR) и текущий процесс из памяти."""
+    directory = directory or settings.METRICS_DIR
+    snapshots = [metrics.snapshot()]
+    if directory and os.path.isdir(directory):
+        own = f'{os.getpid()}.json'
+        for name in os.listdir(directory):
+            if name.endswith('.json') and name != own:
+                snapshot = read_snapshot(os.path.join(directory, name))
+                if snapshot is not None:
+                    snapshots.append(snapshot)
+    return merge(snapshots)
+
+
+def archive(directory, pid):
+    """Добавляет снимок завершенного процесса pid к archived.json."""
+    path = os.path.join(directory, f'{pid}.json')
+    snapshot = read_snapshot(path)
+    if snapshot is None:
+        return
+    archive_path = os.path.join(directory, ARCHIVE)
+    requests, histograms = merge(
+        [read_snapshot(archive_path) or {}, snapshot])
+    write_snapshot(archive_path, dump(requests, histograms))
+    os.remove(path)
+
+
+def escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def labels(**values):
+    return ','.join(f'{name}="{escape(value)}"'
+                    for name, value in values.items())
+
+
+def render(requests, histograms):
+    """Текстовый формат Prometheus 0.0.4."""
+    name, help_text = REQUESTS
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+    for (view, method, status), value in sorted(requests.items()):
+        series = labels(view=view, method=method, status=status)
+        lines.append(f'{name}{{{series}}} {value}')
+    for key, (name, help_text, buckets) in HISTOGRAMS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for (view, method), values in sorted(histograms[key].items()):
+            series = labels(view=view, method=method)
+            count = 0
+            for bound, value in zip((*map(float, buckets), '+Inf'), values):
+                count += value
+                lines.append(f'{name}_bucket{{{series},le="{bound}"}} {count}')
+            lines.append(f'{name}_sum{{{series}}} {values[-1]}')
+            lines.append(f'{name}_count{{{series}}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def view_name(request):
+    """Имя маршрута для меток: для DRF - basename-action."""
+    match = request.resolver_match
+    return match.view_name if match else 'unmatched'
+
+
+def is_allowed(address):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network)
+               for network in settings.METRICS_ALLOWED_NETWORKS)
+
+
+def metrics_view(request):
+    """Метрики для Prometheus, только из сетей METRICS_ALLOWED_NETWORKS."""
+    if not is_allowed(request.META.get('REMOTE_ADDR', '')):
+        raise Http404
+    return HttpResponse(render(*collect()), content_type=CONTENT_TYPE)
@@ -0,0 +1,163 @@
+"""Замер SQL-запросов и этапов обработки запроса.
+
+RequestProfilingMiddleware добавляет к ответу заголовок Server-Timing:
+db - SQL-запросы, serialize - остальная работа вью (в основном
+сериализаторы), render - рендеринг ответа, total - все вместе. Для доли
+REQUEST_PROFILING_SAMPLE_RATE запросов SQL замеряется через
+execute_wrapper соединения, для остальных отдается только total. Тело
+потоковых ответов формируется после возврата из middleware, его запросы
+не учитываются.
+
+Медленные запросы (дольше SLOW_REQUEST_MS) и запросы, в которых одинаковый
+по форме SQL выполнен не меньше N_PLUS_ONE_THRESHOLD раз (признак N+1),
+пишутся в лог api.performance одной строкой JSON с самыми долгими
+запросами.
+
+Те же замеры записываются в метрики api.metrics, если METRICS_ENABLED.
+"""
+import json
+import logging
+import random
+import re
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from api.metrics import metrics, view_name
+
+logger = logging.getLogger('api.performance')
+
+# Списки параметров IN разной длины - одна форма запроса.
+IN_LIST = re.compile(r'\((?:%s, )*%s\)')
+
+
+def sql_shape(sql):
+    return IN_LIST.sub('(...)', sql)
+
+
+class QueryCollector:
+    """execute_wrapper: SQL и длительность каждого запроса."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    def duration(self, start=0, end=None):
+        return sum(duration for _, duration in self.queries[start:end])
+
+    def shapes(self):
+        """{форма SQL: [число выполнений, суммарная длительность]}."""
+        shapes = {}
+        for sql, duration in self.queries:
+            shape = shapes.setdefault(sql_shape(sql), [0, 0])
+            shape[0] += 1
+            shape[1] += duration
+        return shapes
+
+
+class RequestProfile:
+
+    def __init__(self, collector):
+        self.collector = collector
+        self.started = time.perf_counter()
+        self.view_started = self.view_finished = None
+        self.view_queries = self.render_queries = 0
+
+    def queries_count(self):
+        return len(self.collector.queries) if self.collector else 0
+
+
+class RequestProfilingMiddleware:
+    """Server-Timing и лог медленных запросов и N+1. process_view и
+    process_template_response отмечают начало и конец вью."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sampled = random.random() < settings.REQUEST_PROFILING_SAMPLE_RATE
+        profile = request._profile = RequestProfile(
+            QueryCollector() if sampled else None)
+        if sampled:
+            with connection.execute_wrapper(profile.collector):
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+        finished = time.perf_counter()
+        timings = self.timings(profile, finished)
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={duration * 1000:.1f}'
+            for name, duration in timings.items())
+        self.log(request, response, profile, timings)
+        if settings.METRICS_ENABLED:
+            metrics.observe(
+                view_name(request), request.method, response.status_code,
+                timings['total'],
+                None if response.streaming else len(response.content),
+                timings.get('db'))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = request._profile
+        profile.view_started = time.perf_counter()
+        profile.view_queries = profile.queries_count()
+
+    def process_template_response(self, request, response):
+        profile = request._profile
+        profile.view_finished = time.perf_counter()
+        profile.render_queries = profile.queries_count()
+        return response
+
+    def timings(self, profile, finished):
+        timings = {}
+        collector = profile.collector
+        if collector:
+            timings['db'] = collector.duration()
+        if profile.view_started is not None:
+            view_finished = profile.view_finished or finished
+            timings['serialize'] = view_finished - profile.view_started
+            if collector:
+                timings['serialize'] -= collector.duration(
+                    profile.view_queries,
+                    profile.render_queries if profile.view_finished
+                    else None)
+            if profile.view_finished:
+                timings['render'] = finished - profile.view_finished
+                if collector:
+                    timings['render'] -= collector.duration(
+                        profile.render_queries)
+        timings['total'] = finished - profile.started
+        return timings
+
+    def log(self, request, response, profile, timings):
+        slow = timings['total'] * 1000 >= settings.SLOW_REQUEST_MS
+        shapes = profile.collector.shapes() if profile.collector else {}
+        repeated = [
+            {'sql': sql, 'count': count, 'ms': round(duration * 1000, 1)}
+            for sql, (count, duration) in shapes.items()
+            if count >= settings.N_PLUS_ONE_THRESHOLD]
+        if not slow and not repeated:
+            return
+        top = sorted(shapes.items(), key=lambda item: -item[1][1])[
+            :settings.SLOW_REQUEST_TOP_QUERIES]
+        logger.warning(json.dumps({
+            'event': 'slow_request' if slow else 'n_plus_one',
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'timings_ms': {name: round(duration * 1000, 1)
+                           for name, duration in timings.items()},
+            'sampled': profile.collector is not None,
+            'queries': profile.queries_count(),
+            'n_plus_one': repeated,
+            'top_queries': [
+                {'sql': sql, 'count': count, 'ms': round(duration * 1000, 1)}
+                for sql, (count, duration) in top],
+        }, ensure_ascii=False))
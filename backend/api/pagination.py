@@ -1,8 +1,113 @@
+from datetime import datetime
+
 from django.conf import settings
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
+
+from recipes.feed import feed_page
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Курсорная пагинация рецептов по (pub_date, id)."""
+
+    page_size_query_param = 'limit'
+    page_size = settings.PAGE_SIZE
+    ordering = ('-pub_date', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        # Без ?ordering порядок фиксирован, а не берется из OrderingFilter,
+        # у которого нет порядка по умолчанию.
+        if request.query_params.get(OrderingFilter.ordering_param):
+            ordering = OrderingFilter().get_ordering(request, queryset, view)
+            if ordering:
+                return (*ordering, '-id')
+        return self.ordering
+
+
+class UserCursorPagination(CursorPagination):
+    """Курсорная пагинация пользователей и подписок по username."""
+
+    page_size_query_param = 'limit'
+    page_size = settings.PAGE_SIZE
+    ordering = ('username', )
 
 
 class CustomPagination(PageNumberPagination):
+    """Постраничная пагинация с COUNT(*) и OFFSET. С ?pagination=cursor
+    (и в ссылках next/previous с ?cursor=) страницы отдает
+    cursor_pagination_class: без подсчета общего числа объектов и за
+    постоянное время на любой глубине."""
 
     page_size_query_param = 'limit'
     page_size = settings.PAGE_SIZE
+    pagination_mode_param = 'pagination'
+    cursor_pagination_class = None
+
+    def use_cursor(self, request):
+        return self.cursor_pagination_class is not None and (
+            request.query_params.get(self.pagination_mode_param) == 'cursor'
+            or CursorPagination.cursor_query_param in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.use_cursor(request):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+
+        return super().get_paginated_response(data)
+
+
+class RecipePagination(CustomPagination):
+    cursor_pagination_class = RecipeCursorPagination
+
+
+class UserPagination(CustomPagination):
+    cursor_pagination_class = UserCursorPagination
+
+
+class FeedPagination(CursorPagination):
+    """Курсорная пагинация ленты подписок по (pub_date, id) только вперед.
+    id рецептов страницы дает recipes.feed.feed_page, сами рецепты
+    выбираются одним запросом из queryset вью."""
+
+    page_size_query_param = 'limit'
+    page_size = settings.PAGE_SIZE
+    ordering = ('-pub_date', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        before = self.parse_position(cursor.position) if cursor else None
+        rows = feed_page(request.user.pk, self.page_size + 1, before)
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_position = rows[-1] if rows else None
+        recipes = queryset.in_bulk([pk for _, pk in rows])
+        return [recipes[pk] for _, pk in rows if pk in recipes]
+
+    def parse_position(self, position):
+        try:
+            pub_date, pk = position.split('|')
+            return datetime.fromisoformat(pub_date), int(pk)
+        except (AttributeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        pub_date, pk = self.next_position
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=False, position=f'{pub_date.isoformat()}|{pk}'))
+
+    def get_previous_link(self):
+        return None
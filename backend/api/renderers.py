@@ -0,0 +1,49 @@
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Базовый класс форматов выгрузки списка покупок.
+
+    Файл формируется потоково во вьюсете, рендерер нужен для согласования
+    формата по ?format= и заголовку Accept. Ответы с ошибками вьюсет
+    отдает через JSONRenderer.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+class ShoppingListXLSRenderer(ShoppingListRenderer):
+    media_type = 'application/vnd.ms-excel'
+    format = 'xls'
+    charset = None
+
+
+class ShoppingListXLSXRenderer(ShoppingListRenderer):
+    media_type = ('application/vnd.openxmlformats-officedocument.'
+                  'spreadsheetml.sheet')
+    format = 'xlsx'
+    charset = None
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+# Первый рендерер используется по умолчанию: .xls ожидает фронтенд.
+SHOPPING_LIST_RENDERERS = (
+    ShoppingListXLSRenderer,
+    ShoppingListXLSXRenderer,
+    ShoppingListCSVRenderer,
+    ShoppingListTextRenderer,
+    JSONRenderer,
+)
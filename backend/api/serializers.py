@@ -1,24 +1,46 @@
-import base64
-
-from django.core.files.base import ContentFile
+from django.conf import settings
 from django.db import transaction
+from django.db.models import (OuterRef, Prefetch, Subquery,
+                              prefetch_related_objects)
 from djoser.serializers import UserSerializer
 from rest_framework import serializers
-from rest_framework.validators import UniqueTogetherValidator
 
-from recipes.models import (Cart, Favorite, Ingredient, Recipe,
-                            RecipeIngredient, Tag)
+from api.uploads import (check_image_header, check_image_size,
+                         decode_base64_image)
+from recipes.images import normalize_image, thumbnail_urls
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.shopping_cart import update_shopping_lists
+from recipes.similarity import index_recipes
 from users.models import Follow, User
 
 
 class Base64ImageField(serializers.ImageField):
+    """Изображение data URL (base64) или файлом multipart/form-data."""
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = decode_base64_image(data)
+        elif hasattr(data, 'size'):
+            check_image_size(data.size)
+            check_image_header(data)
+
+        return normalize_image(super().to_internal_value(data))
+
 
-        return super().to_internal_value(data)
+class ThumbnailsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии изображения рецепта."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        request = self.context.get('request')
+        urls = thumbnail_urls(recipe)
+        if request is None:
+            return urls
+        return {size: request.build_absolute_uri(url)
+                for size, url in urls.items()}
 
 
 class UserListSerializer(UserSerializer):
@@ -35,6 +57,8 @@ class UserListSerializer(UserSerializer):
                   'is_subscribed')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         return (request and request.user.is_authenticated
                 and Follow.objects.filter(user=request.user,
@@ -57,9 +81,11 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 class RecipeShortSerializer(serializers.ModelSerializer):
     """Сериализатор сокращенного отображения рецептов."""
+    thumbnails = ThumbnailsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'thumbnails', 'cooking_time')
 
 
 class IngredientShowSerializer(serializers.ModelSerializer):
@@ -85,6 +111,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     author = UserListSerializer()
     is_favorited = serializers.BooleanField(default=False)
     is_in_shopping_cart = serializers.BooleanField(default=False)
+    thumbnails = ThumbnailsField()
 
     class Meta:
         model = Recipe
@@ -97,16 +124,16 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'thumbnails',
             'text',
             'cooking_time')
 
 
 class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
     """Сериализатор сохранения ингредиентов в рецептах."""
-    id = serializers.PrimaryKeyRelatedField(
-        source='ingredient',
-        queryset=Ingredient.objects.all()
-    )
+    # Существование ингредиентов проверяется одним запросом в
+    # RecipeCreateSerializer.validate_ingredients.
+    id = serializers.IntegerField(source='ingredient_id')
 
     class Meta:
         model = RecipeIngredient
@@ -137,18 +164,55 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         """Функция для передачи request в context, для получения данных
         о пользователе в сериализаторах."""
+        # Состав рецепта одним запросом, а не по запросу на ингредиент.
+        prefetch_related_objects(
+            [instance], 'tags', Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient')))
         serializer = RecipeSerializer(
             instance,
             context={'request': self.context.get('request')})
         return serializer.data
 
-    def create_update_recipe(self, ingredients_data, recipe):
-        """Функция для сохранения/обновления вложенных полей рецепта."""
-        recipe_ingredients = []
-        for ingredient_data in ingredients_data:
-            recipe_ingredients.append(RecipeIngredient(recipe=recipe,
-                                                       **ingredient_data))
-        RecipeIngredient.objects.bulk_create(recipe_ingredients)
+    def create_ingredients(self, ingredients_data, recipe):
+        """Функция для сохранения ингредиентов нового рецепта."""
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, **ingredient_data)
+            for ingredient_data in ingredients_data)
+
+    def update_ingredients(self, ingredients_data, recipe):
+        """Изменение состава рецепта по разнице с текущим: удаление,
+        изменение количества и добавление строк не больше чем одним
+        запросом каждое. Возвращает прежнее и новое количество
+        ингредиентов: {ingredient_id: amount}."""
+        current = {
+            row.ingredient_id: row
+            for row in RecipeIngredient.objects.filter(recipe=recipe).only(
+                'id', 'ingredient_id', 'amount')}
+        old_amounts = {ingredient_id: row.amount
+                       for ingredient_id, row in current.items()}
+        new_amounts = {data['ingredient_id']: data['amount']
+                       for data in ingredients_data}
+        removed, changed = [], []
+        for ingredient_id, row in current.items():
+            amount = new_amounts.get(ingredient_id)
+            if amount is None:
+                removed.append(row.pk)
+            elif amount != row.amount:
+                row.amount = amount
+                changed.append(row)
+        added = [RecipeIngredient(recipe=recipe, ingredient_id=ingredient_id,
+                                  amount=amount)
+                 for ingredient_id, amount in new_amounts.items()
+                 if ingredient_id not in current]
+        if removed:
+            RecipeIngredient.objects.filter(pk__in=removed).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        if added:
+            RecipeIngredient.objects.bulk_create(added)
+        return old_amounts, new_amounts
 
     @transaction.atomic
     def create(self, validated_data):
@@ -157,17 +221,35 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         validated_data['author'] = user
         ingredients_data = validated_data.pop('ingredients')
         recipe = super().create(validated_data)
-        self.create_update_recipe(ingredients_data, recipe)
+        self.create_ingredients(ingredients_data, recipe)
+        index_recipes([recipe.pk])
         return recipe
 
     @transaction.atomic
-    def update(self, validated_data, instance):
-        """Функция для обновления вложенных полей."""
-        ingredients_data = instance.pop('ingredients')
-        validated_data.ingredients.clear()
-        validated_data.tags.clear()
-        self.create_update_recipe(ingredients_data, validated_data)
-        return super().update(validated_data, instance)
+    def update(self, instance, validated_data):
+        """Функция для обновления вложенных полей. Теги обновляет
+        ModelSerializer через set(), то есть тоже по разнице."""
+        ingredients_data = validated_data.pop('ingredients')
+        old_amounts, new_amounts = self.update_ingredients(
+            ingredients_data, instance)
+        update_shopping_lists(instance, old_amounts, new_amounts)
+        recipe = super().update(instance, validated_data)
+        index_recipes([recipe.pk])
+        return recipe
+
+    def validate_ingredients(self, value):
+        """Проверка существования всех ингредиентов одним запросом."""
+        ingredient_ids = [data['ingredient_id'] for data in value]
+        existing = set(Ingredient.objects.filter(
+            pk__in=ingredient_ids).values_list('pk', flat=True))
+        if existing.issuperset(ingredient_ids):
+            return value
+        message = serializers.PrimaryKeyRelatedField.default_error_messages[
+            'does_not_exist']
+        raise serializers.ValidationError([
+            {} if ingredient_id in existing
+            else {'id': [message.format(pk_value=ingredient_id)]}
+            for ingredient_id in ingredient_ids])
 
     def validate(self, attrs):
         if not attrs.get('ingredients'):
@@ -175,7 +257,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                 {'message': 'You cant create recipe without ingredients!'})
         values_list = []
         for value in attrs['ingredients']:
-            values_list.append(value['ingredient'].id)
+            values_list.append(value['ingredient_id'])
         values_set = set(values_list)
         if len(values_list) != len(values_set):
             raise serializers.ValidationError(
@@ -195,7 +277,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
 class SubscriptionsSerializer(UserListSerializer):
     '''Сериализатор просмотра подписок.'''
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -209,74 +291,54 @@ class SubscriptionsSerializer(UserListSerializer):
                   'recipes_count',
                   )
 
-    def get_recipes(self, obj):
-        recipes = obj.recipes.all()
-        recipes_limit = self.context['request'].query_params.get(
-            'recipes_limit')
-        if recipes_limit:
-            recipes = recipes[:int(recipes_limit)]
-            return RecipeShortSerializer(recipes, many=True).data
-
-        return RecipeShortSerializer(recipes, many=True).data
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
-
-class SubscribeSerializer(serializers.ModelSerializer):
-    '''Сериализатор создания/удаления подписок.'''
-    class Meta:
-        model = Follow
-        fields = ('user',
-                  'following',)
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Follow.objects.all(),
-                fields=('user', 'following'),
-                message='Подписка уже существует.'
-            )
-        ]
-
-    def validate_following(self, following):
-        if self.context['request'].user == following:
+    @staticmethod
+    def get_recipes_limit(request):
+        """Проверка параметра recipes_limit, ограничение сверху
+        MAX_RECIPES_LIMIT."""
+        recipes_limit = request.query_params.get('recipes_limit')
+        if recipes_limit is None:
+            return None
+        try:
+            recipes_limit = int(recipes_limit)
+        except ValueError:
+            recipes_limit = -1
+        if recipes_limit < 0:
             raise serializers.ValidationError(
-                'You cant follow yourself!')
-        return following
-
-    def to_representation(self, instance):
-        serializer = SubscriptionsSerializer(
-            instance.following, context={
-                'request': self.context.get('request')})
-        return serializer.data
-
+                {'recipes_limit': 'Must be a non-negative integer!'})
+        return min(recipes_limit, settings.MAX_RECIPES_LIMIT)
+
+    @classmethod
+    def setup_queryset(cls, queryset, request):
+        """Добавление в queryset авторов подписки и последних
+        recipes_limit рецептов каждого автора одним запросом."""
+        recipes = Recipe.objects.all()
+        recipes_limit = cls.get_recipes_limit(request)
+        if recipes_limit is not None:
+            latest_recipes = Recipe.objects.filter(
+                author=OuterRef('author')).order_by(
+                    '-pub_date', '-id').values('pk')[:recipes_limit]
+            recipes = recipes.filter(pk__in=Subquery(latest_recipes))
+        return queryset.add_is_subscribed_subquery(
+            user=request.user).prefetch_related(
+                Prefetch('recipes', queryset=recipes,
+                         to_attr='limited_recipes'))
 
-class FavoriteSerializer(serializers.ModelSerializer):
-    """Сериализатор записи/удаления рецептов в избранном."""
-
-    class Meta:
-        model = Favorite
-        fields = ('user', 'recipe')
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Favorite.objects.all(),
-                fields=('user', 'recipe'),
-                message='Рецепт уже в избранном.'
-            )]
+    def get_recipes(self, obj):
+        if hasattr(obj, 'limited_recipes'):
+            return RecipeShortSerializer(obj.limited_recipes, many=True).data
 
-    def to_representation(self, instance):
-        serializer = RecipeShortSerializer(instance.recipe)
-        return serializer.data
+        recipes = obj.recipes.all()
+        recipes_limit = self.get_recipes_limit(self.context['request'])
+        if recipes_limit is not None:
+            recipes = recipes[:recipes_limit]
+        return RecipeShortSerializer(recipes, many=True).data
 
 
-class ShopingCardSerializer(FavoriteSerializer):
-    """Сериализатор записи/удаления рецептов в корзине."""
+class RecipeIdsSerializer(serializers.Serializer):
+    """Сериализатор списка id рецептов для массовых операций."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False,
+        max_length=settings.BULK_RECIPES_LIMIT)
 
-    class Meta:
-        model = Cart
-        fields = ('user', 'recipe')
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Cart.objects.all(),
-                fields=('user', 'recipe'),
-                message='Рецепт уже в корзине.')
-        ]
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
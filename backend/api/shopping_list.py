@@ -0,0 +1,87 @@
+import csv
+import tempfile
+
+import xlwt
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from openpyxl import Workbook
+from rest_framework.response import Response
+
+SHEET_TITLE = 'Список продуктов'
+FILENAME = 'list_ingredients'
+HEADER = ('Ингредиент', 'Единица измерения', 'Количество')
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: возвращает строку вместо записи."""
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    """Построчная выгрузка в CSV. BOM нужен Excel для кириллицы."""
+    writer = csv.writer(Echo())
+    yield '\ufeff' + writer.writerow(HEADER)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_text(rows):
+    """Построчная выгрузка в текст."""
+    for name, measurement_unit, amount in rows:
+        yield f'{name} ({measurement_unit}) — {amount}\n'
+
+
+def write_xlsx(rows):
+    """Запись XLSX во временный файл, в режиме write_only openpyxl
+    не держит книгу в памяти."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(SHEET_TITLE)
+    ws.append(HEADER)
+    for row in rows:
+        ws.append(row)
+    file = tempfile.TemporaryFile()
+    wb.save(file)
+    file.seek(0)
+    return file
+
+
+def write_xls(response, rows):
+    """Выгрузка в устаревший формат .xls, собирается в памяти."""
+    wb = xlwt.Workbook(encoding='utf-8')
+    ws = wb.add_sheet(SHEET_TITLE)
+    for row_num, (name, measurement_unit, amount) in enumerate(rows):
+        ws.write(row_num, 0, f'{name},{measurement_unit}')
+        ws.write(row_num, 1, amount)
+    wb.save(response)
+
+
+def shopping_list_response(renderer, rows):
+    """Ответ со списком покупок в формате, выбранном рендерером.
+
+    rows - итератор кортежей (название, единица измерения, количество).
+    """
+    export_format = renderer.format
+    if export_format == 'json':
+        return Response([
+            {'name': name,
+             'measurement_unit': measurement_unit,
+             'amount': amount}
+            for name, measurement_unit, amount in rows])
+
+    content_type = renderer.media_type
+    if renderer.charset:
+        content_type = f'{content_type}; charset={renderer.charset}'
+    if export_format == 'csv':
+        response = StreamingHttpResponse(stream_csv(rows),
+                                         content_type=content_type)
+    elif export_format == 'txt':
+        response = StreamingHttpResponse(stream_text(rows),
+                                         content_type=content_type)
+    elif export_format == 'xlsx':
+        response = FileResponse(write_xlsx(rows), content_type=content_type)
+    else:
+        response = HttpResponse(content_type=content_type)
+        write_xls(response, rows)
+    response['Content-Disposition'] = (
+        f'attachment; filename="{FILENAME}.{export_format}"')
+    return response
@@ -0,0 +1,125 @@
+"""Загрузка изображений рецептов с ограниченным потреблением памяти.
+
+Изображение принимается data URL в JSON или файлом multipart/form-data.
+base64 декодируется частями во временный файл на диске, файлы multipart
+больше FILE_UPLOAD_MAX_MEMORY_SIZE Django сам пишет во временный файл.
+Размер проверяется до декодирования (по длине base64 и Content-Length),
+формат и число пикселей - по заголовку изображения после первой части
+данных, до чтения остального.
+"""
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.http.multipartparser import MultiPartParserError
+from PIL import Image, UnidentifiedImageError
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+# Формат Pillow и тип содержимого допустимых изображений.
+IMAGE_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+    'GIF': 'image/gif',
+}
+DATA_URL_HEADER_LIMIT = 100
+# Кратно 4, чтобы части base64 декодировались независимо.
+BASE64_CHUNK_SIZE = 256 * 1024
+# Запас на остальные поля формы multipart.
+MULTIPART_FIELDS_MAX_SIZE = 1024 * 1024
+
+
+def check_image_header(file):
+    """Проверка формата и числа пикселей по заголовку изображения."""
+    position = file.tell()
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            image_format, (width, height) = image.format, image.size
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise serializers.ValidationError('Upload a valid image!')
+    finally:
+        file.seek(position)
+    if image_format not in IMAGE_TYPES:
+        raise serializers.ValidationError(
+            f'Unsupported image format: {image_format}!')
+    if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+        raise serializers.ValidationError(
+            f'Image is larger than {settings.IMAGE_UPLOAD_MAX_PIXELS} '
+            f'pixels!')
+
+
+def check_image_size(size):
+    if size > settings.IMAGE_UPLOAD_MAX_SIZE:
+        raise serializers.ValidationError(
+            f'Image is larger than {settings.IMAGE_UPLOAD_MAX_SIZE} bytes!')
+
+
+def decode_base64_image(data):
+    """Декодирование data URL по частям во временный файл."""
+    header_end = data.find(';base64,', 0, DATA_URL_HEADER_LIMIT)
+    content_type = data[len('data:'):header_end]
+    if header_end == -1 or content_type not in IMAGE_TYPES.values():
+        raise serializers.ValidationError('Upload a valid image!')
+    start = header_end + len(';base64,')
+    check_image_size((len(data) - start) // 4 * 3)
+
+    extension = content_type.split('/')[-1]
+    file = TemporaryUploadedFile(f'image.{extension}', content_type, 0, None)
+    try:
+        for offset in range(start, len(data), BASE64_CHUNK_SIZE):
+            try:
+                file.write(base64.b64decode(
+                    data[offset:offset + BASE64_CHUNK_SIZE], validate=True))
+            except binascii.Error:
+                raise serializers.ValidationError('Invalid base64 data!')
+            if offset == start:
+                file.flush()
+                check_image_header(file)
+    except serializers.ValidationError:
+        file.close()
+        raise
+    file.size = file.tell()
+    file.seek(0)
+    return file
+
+
+class ImageUploadLimitHandler(FileUploadHandler):
+    """Прерывание multipart-загрузки больше IMAGE_UPLOAD_MAX_SIZE: по
+    Content-Length до чтения тела, иначе по мере получения файла."""
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        if content_length > (settings.IMAGE_UPLOAD_MAX_SIZE
+                             + MULTIPART_FIELDS_MAX_SIZE):
+            raise MultiPartParserError('Request body is too large!')
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.IMAGE_UPLOAD_MAX_SIZE:
+            raise MultiPartParserError('Image is too large!')
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+class RecipeMultiPartParser(MultiPartParser):
+    """multipart/form-data для рецептов: изображение файлом, ingredients и
+    tags - JSON-строками."""
+    json_fields = ('ingredients', 'tags')
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parsed = super().parse(stream, media_type, parser_context)
+        data = parsed.data.dict()
+        for field in self.json_fields:
+            if field in data:
+                try:
+                    data[field] = json.loads(data[field])
+                except ValueError:
+                    raise ParseError(f'{field} must be a JSON string!')
+        return DataAndFiles(data, parsed.files.dict())
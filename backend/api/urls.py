@@ -9,7 +9,7 @@ router.register('tags', TagViewSet, basename='tags')
 router.register('ingredients', IngredientViewSet, basename='ingredients')
 
 router.register('recipes', RecipeViewSet, basename='recipes')
-router.register('users', DjoserUserViewSet)
+router.register('users', DjoserUserViewSet, basename='users')
 
 
 urlpatterns = [
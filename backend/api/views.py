@@ -1,31 +1,57 @@
-from collections import defaultdict
+import hashlib
 
-import xlwt
-from django.db.models import Prefetch
-from django.http import HttpResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Prefetch
+from django.http import HttpResponseNotModified
 from django.shortcuts import get_object_or_404
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, parse_etags
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser import views
 from rest_framework import filters, serializers, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
-from api.filters import IngredientFilter, RecipeFilter
-from api.pagination import CustomPagination
+from api.filters import IngredientFilter, RecipeFilter, RecipeSearchFilter
+from api.pagination import FeedPagination, RecipePagination, UserPagination
 from api.permissions import IsOwnerOrAdminOrReadOnly
-from api.serializers import (FavoriteSerializer, IngredientSerializer,
-                             RecipeCreateSerializer, RecipeSerializer,
-                             ShopingCardSerializer, SubscribeSerializer,
-                             SubscriptionsSerializer, TagSerializer)
+from api.renderers import SHOPPING_LIST_RENDERERS
+from api.serializers import (IngredientSerializer, RecipeCreateSerializer,
+                             RecipeIdsSerializer, RecipeSerializer,
+                             RecipeShortSerializer, SubscriptionsSerializer,
+                             TagSerializer)
+from api.shopping_list import shopping_list_response
+from api.uploads import ImageUploadLimitHandler, RecipeMultiPartParser
+from recipes.images import thumbnail_urls
+from recipes.ingredient_index import ingredient_index
 from recipes.models import (Cart, Favorite, Ingredient, Recipe,
-                            RecipeIngredient, Tag, User)
+                            RecipeIngredient, ShoppingListItem, Tag, User)
+from recipes.reference_data import (INGREDIENTS, RECIPES, TAGS, get_version,
+                                    get_versions)
+from recipes.similarity import similar_recipes
+from recipes.user_relations import (add_recipes, follow, remove_recipes,
+                                    unfollow)
 from users.models import Follow
 
 
+def does_not_exist(field, pk):
+    """Ошибка ссылки на несуществующий объект, как у
+    PrimaryKeyRelatedField."""
+    message = serializers.PrimaryKeyRelatedField.default_error_messages[
+        'does_not_exist']
+    return serializers.ValidationError({field: [message.format(pk_value=pk)]})
+
+
 class DjoserUserViewSet(views.UserViewSet):
     """Всюсет пользователей."""
-    pagination_class = CustomPagination
+    pagination_class = UserPagination
+    lookup_value_regex = r'\d+'
 
     def get_permissions(self):
         if self.action == 'me':
@@ -33,11 +59,20 @@ class DjoserUserViewSet(views.UserViewSet):
 
         return super().get_permissions()
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset
+
+        return queryset.add_is_subscribed_subquery(user=user)
+
     @action(["get", ], detail=False,
             permission_classes=[IsAuthenticated],
             serializer_class=SubscriptionsSerializer)
     def subscriptions(self, request):
-        queryset = User.objects.filter(following__user=request.user)
+        queryset = SubscriptionsSerializer.setup_queryset(
+            User.objects.filter(following__user=request.user), request)
         queryset = self.paginate_queryset(queryset)
         serializer = SubscriptionsSerializer(queryset, many=True,
                                              context={'request': request})
@@ -47,19 +82,26 @@ class DjoserUserViewSet(views.UserViewSet):
             permission_classes=[IsAuthenticated])
     def subscribe(self, request, id):
         current_user = request.user
+        following_id = int(id)
         if self.request.method == 'POST':
-            serializer = SubscribeSerializer(
-                data={'user': current_user.id,
-                      'following': id}, context={'request': request})
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
+            SubscriptionsSerializer.get_recipes_limit(request)
+            if following_id == current_user.id:
+                raise serializers.ValidationError(
+                    {'following': ['You cant follow yourself!']})
+            if not follow(current_user.id, following_id):
+                if not User.objects.filter(pk=following_id).exists():
+                    raise does_not_exist('following', following_id)
+                raise serializers.ValidationError(
+                    {api_settings.NON_FIELD_ERRORS_KEY: [
+                        'Подписка уже существует.']})
+            following = SubscriptionsSerializer.setup_queryset(
+                User.objects.filter(pk=following_id), request).get()
+            serializer = SubscriptionsSerializer(
+                following, context={'request': request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-        following_user = get_object_or_404(User, id=id)
-        subscription = Follow.objects.filter(user=current_user,
-                                             following=following_user)
-        deleted = subscription.delete()[0]
-        if not deleted:
+        if not unfollow(current_user.id, following_id):
+            get_object_or_404(User, id=following_id)
             raise serializers.ValidationError(
                 {"error": "You are not following this user!"})
         return Response(
@@ -68,14 +110,50 @@ class DjoserUserViewSet(views.UserViewSet):
 
 
 class TagIngredientSubscriptionsMixin(viewsets.ReadOnlyModelViewSet):
-    """Базовый класс для тегов, ингредиентов и подписок"""
+    """Базовый класс для тегов, ингредиентов и подписок.
+
+    Ответы справочника reference_data отдаются с ETag и Last-Modified по
+    его версии (304 на условные запросы), сериализованные данные кешируются
+    с версией в ключе.
+    """
     permission_classes = (AllowAny,)
+    reference_data = None
+
+    def list(self, request, *args, **kwargs):
+        return self.reference_data_response(
+            request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.reference_data_response(
+            request, super().retrieve, *args, **kwargs)
+
+    def reference_data_response(self, request, view, *args, **kwargs):
+        stamp = get_version(self.reference_data)
+        etag = f'"{self.reference_data}-{stamp.version}"'
+        last_modified = int(stamp.updated_at.timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            key = (f'reference-data:{self.reference_data}:{stamp.version}:'
+                   f'{request.get_full_path()}')
+            data = cache.get(key)
+            if data is None:
+                data = view(request, *args, **kwargs).data
+                cache.set(key, data, settings.REFERENCE_DATA_CACHE_TIMEOUT)
+            response = Response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, public=True,
+                            max_age=settings.REFERENCE_DATA_MAX_AGE)
+        patch_vary_headers(response, ('Accept', ))
+        return response
 
 
 class TagViewSet(TagIngredientSubscriptionsMixin):
     """Вьюсет для просмотра тегов"""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    reference_data = TAGS
 
 
 class IngredientViewSet(TagIngredientSubscriptionsMixin):
@@ -85,18 +163,43 @@ class IngredientViewSet(TagIngredientSubscriptionsMixin):
     filter_backends = (DjangoFilterBackend, filters.SearchFilter, )
     filterset_class = IngredientFilter
     search_fields = ('^name',)
+    reference_data = INGREDIENTS
+
+    def list(self, request, *args, **kwargs):
+        """Автодополнение по ?name= обслуживается индексом в памяти."""
+        name = request.query_params.get('name')
+        if name is None:
+            return super().list(request, *args, **kwargs)
+
+        ingredients = ingredient_index.search(
+            name, settings.INGREDIENT_SEARCH_LIMIT)
+        serializer = self.get_serializer(ingredients, many=True)
+        return Response(serializer.data)
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """Вьюсет для создания/редактирования и просмотра рецептов."""
     queryset = Recipe.objects.all()
     serializer_class = RecipeCreateSerializer
-    filter_backends = (DjangoFilterBackend, filters.SearchFilter, )
+    filter_backends = (DjangoFilterBackend, RecipeSearchFilter,
+                       filters.OrderingFilter, )
     filterset_class = RecipeFilter
     search_fields = ('^name', )
+    ordering_fields = ('pub_date', 'favorites_count', )
     http_method_names = ('get', 'post', 'patch', 'delete', )
     permission_classes = (IsOwnerOrAdminOrReadOnly, )
-    pagination_class = CustomPagination
+    pagination_class = RecipePagination
+    lookup_value_regex = r'\d+'
+    parser_classes = (JSONParser, RecipeMultiPartParser, )
+    # Фильтры, результат которых зависит от пользователя.
+    personal_filters = ('is_favorited', 'is_in_shopping_cart', )
+    # Сортировки по полям, которые меняются без изменения версии каталога.
+    uncached_orderings = ('favorites_count', )
+    shared_page = False
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        request.upload_handlers.insert(0, ImageUploadLimitHandler(request))
 
     def get_serializer_class(self):
         if self.action in ('create', 'partial_update'):
@@ -106,32 +209,102 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        queryset = Recipe.objects.all().select_related(
-            'author').prefetch_related('tags').prefetch_related(
+        queryset = Recipe.objects.all().prefetch_related(
+            'tags').prefetch_related(
                 Prefetch('recipe_ingredients',
                          queryset=RecipeIngredient.objects.select_related(
                              'ingredient')))
-        if not user.is_authenticated:
-            return queryset
+        if self.shared_page or not user.is_authenticated:
+            return queryset.select_related('author')
 
         queryset = queryset.add_is_in_cart_subquery(
-            user=user).add_is_favorite_subquery(user=user)
+            user=user).add_is_favorite_subquery(user=user).prefetch_related(
+                Prefetch('author',
+                         queryset=User.objects.add_is_subscribed_subquery(
+                             user=user)))
         return queryset
 
-    def _add_recipe_to_user(self, request, pk, Serializer):
-        serializer = Serializer(
-            data={'user': request.user.id, 'recipe': pk},
-            context={'request': request})
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+    def list(self, request, *args, **kwargs):
+        """Страница списка без персональных фильтров общая для всех и
+        кешируется до изменения рецептов, тегов, ингредиентов или авторов;
+        копии изображений и флаги пользователя накладываются на нее одним
+        запросом."""
+        if not self.is_cacheable(request):
+            return super().list(request, *args, **kwargs)
+
+        versions = get_versions((RECIPES, TAGS, INGREDIENTS))
+        url = hashlib.md5(
+            request.build_absolute_uri().encode()).hexdigest()
+        key = 'recipe-list:{}:{}:{}:{}'.format(
+            *versions.values(), url)
+        data = cache.get(key)
+        if data is None:
+            data = self.shared_list_data(request)
+            cache.set(key, data, settings.RECIPE_LIST_CACHE_TIMEOUT)
+        self.apply_fresh_fields(data['results'], request)
+        return Response(data)
+
+    def is_cacheable(self, request):
+        params = request.query_params
+        ordering = params.get('ordering', '').split(',')
+        return not (
+            any(params.get(name) for name in self.personal_filters)
+            or any(field.strip().lstrip('-') in self.uncached_orderings
+                   for field in ordering))
+
+    def shared_list_data(self, request):
+        self.shared_page = True
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        for recipe in page:
+            recipe.author.is_subscribed = False
+        serializer = self.get_serializer(page, many=True)
+        data = self.get_paginated_response(serializer.data).data
+        for recipe in data['results']:
+            recipe['thumbnails'] = None
+        return data
+
+    def apply_fresh_fields(self, recipes, request):
+        """Копии изображений и флаги пользователя для страницы из кеша
+        одним запросом: копии строятся в фоне после сохранения рецепта и
+        версию каталога не меняют."""
+        user = request.user
+        queryset = Recipe.objects.filter(
+            pk__in=[recipe['id'] for recipe in recipes]).only(
+                'id', 'image', 'thumbnails').order_by()
+        if user.is_authenticated:
+            queryset = queryset.add_is_favorite_subquery(
+                user=user).add_is_in_cart_subquery(user=user).annotate(
+                    is_subscribed=Exists(Follow.objects.filter(
+                        user=user, following=OuterRef('author'))))
+        fresh = {recipe.id: recipe for recipe in queryset}
+        for recipe in recipes:
+            row = fresh.get(recipe['id'])
+            recipe['thumbnails'] = {
+                size: request.build_absolute_uri(url)
+                for size, url in thumbnail_urls(row).items()
+            } if row else {}
+            if user.is_authenticated:
+                recipe['is_favorited'] = getattr(row, 'is_favorited', False)
+                recipe['is_in_shopping_cart'] = getattr(
+                    row, 'is_in_shopping_cart', False)
+                recipe['author']['is_subscribed'] = getattr(
+                    row, 'is_subscribed', False)
+
+    def _add_recipe_to_user(self, request, pk, Model, message):
+        pk = int(pk)
+        if not add_recipes(Model, request.user.id, [pk]):
+            if not Recipe.objects.filter(pk=pk).exists():
+                raise does_not_exist('recipe', pk)
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [message]})
+        serializer = RecipeShortSerializer(Recipe.objects.get(pk=pk))
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def _remove_recipe_from_user(self, request, pk, Model, obj):
-        recipe = get_object_or_404(Recipe, id=pk)
-        favorite_recipe = Model.objects.filter(user=request.user,
-                                               recipe=recipe)
-        deleted = favorite_recipe.delete()[0]
-        if not deleted:
+        pk = int(pk)
+        if not remove_recipes(Model, request.user.id, [pk]):
+            get_object_or_404(Recipe, id=pk)
             raise serializers.ValidationError(
                 {'error': f'This recipe is not in {obj}!'})
         return Response(
@@ -142,7 +315,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
             permission_classes=[IsAuthenticated])
     def favorite(self, request, pk, *args):
         if self.request.method == 'POST':
-            return self._add_recipe_to_user(request, pk, FavoriteSerializer)
+            return self._add_recipe_to_user(request, pk, Favorite,
+                                            'Рецепт уже в избранном.')
 
         return self._remove_recipe_from_user(request, pk, Favorite,
                                              obj='favorite')
@@ -151,32 +325,99 @@ class RecipeViewSet(viewsets.ModelViewSet):
             permission_classes=[IsAuthenticated])
     def shopping_cart(self, request, pk, *args):
         if self.request.method == 'POST':
-            return self._add_recipe_to_user(request, pk, ShopingCardSerializer)
+            return self._add_recipe_to_user(request, pk, Cart,
+                                            'Рецепт уже в корзине.')
 
         return self._remove_recipe_from_user(request, pk, Cart,
                                              obj='shopping cart')
 
-    @action(['get', ], detail=False,
+    def _change_recipes_in_bulk(self, request, Model):
+        """Массовое добавление/удаление рецептов: статус для каждого id."""
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        existing = set(Recipe.objects.filter(pk__in=recipe_ids).values_list(
+            'pk', flat=True))
+        if request.method == 'POST':
+            changed = set(add_recipes(Model, request.user.id, recipe_ids))
+            statuses = {True: 'added', False: 'exists'}
+        else:
+            changed = set(remove_recipes(Model, request.user.id, recipe_ids))
+            statuses = {True: 'removed', False: 'absent'}
+        return Response({'results': [
+            {'id': pk, 'status': statuses[pk in changed] if pk in existing
+             else 'not_found'} for pk in recipe_ids]})
+
+    @action(['post', 'delete'], detail=False, url_path='favorite',
+            url_name='favorite-bulk', permission_classes=[IsAuthenticated])
+    def favorite_bulk(self, request):
+        return self._change_recipes_in_bulk(request, Favorite)
+
+    @action(['post', 'delete'], detail=False, url_path='shopping_cart',
+            url_name='shopping-cart-bulk',
             permission_classes=[IsAuthenticated])
+    def shopping_cart_bulk(self, request):
+        return self._change_recipes_in_bulk(request, Cart)
+
+    @action(['get', ], detail=True)
+    def similar(self, request, pk):
+        """Рецепты с наиболее похожим составом: ингредиентами и тегами."""
+        recipe = get_object_or_404(Recipe, id=pk)
+        limit = request.query_params.get(
+            'limit', settings.SIMILAR_RECIPES_LIMIT)
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            raise serializers.ValidationError(
+                {'limit': 'Must be a positive integer!'})
+        ranked = similar_recipes(
+            recipe.pk, min(limit, settings.MAX_RECIPES_LIMIT))
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for _, recipe_id in ranked])
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for _, recipe_id in ranked
+             if recipe_id in recipes], many=True)
+        return Response(serializer.data)
+
+    @action(['get', ], detail=False,
+            permission_classes=[IsAuthenticated],
+            pagination_class=FeedPagination)
+    def feed(self, request):
+        """Новые рецепты авторов, на которых подписан пользователь."""
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Ошибки выгрузки списка покупок - JSON, а не файл выбранного
+        # формата, иначе браузер сохранит ошибку как испорченный .xls.
+        if (self.action == 'download_shopping_cart'
+                and getattr(response, 'exception', False)):
+            request.accepted_renderer = JSONRenderer()
+            request.accepted_media_type = JSONRenderer.media_type
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    @action(['get', ], detail=False,
+            permission_classes=[IsAuthenticated],
+            renderer_classes=SHOPPING_LIST_RENDERERS)
     def download_shopping_cart(self, request):
         user = request.user
-        user_cart = Recipe.objects.filter(recipe_in_cart__user=user)
-        shopping_ingredients = defaultdict(int)
-        for recipe in user_cart:
-            for ingredient in recipe.recipe_ingredients.all():
-                shopping_ingredients[
-                    f'{ingredient.ingredient},'
-                    f'{ingredient.ingredient.measurement_unit}'
-                ] += ingredient.amount
-        wb = xlwt.Workbook(encoding='utf-8')
-        ws = wb.add_sheet('Список продуктов')
-        row_num = 0
-        for key, value in shopping_ingredients.items():
-            ws.write(row_num, 0, key)
-            ws.write(row_num, 1, value)
-            row_num += 1
-        response = HttpResponse(content_type='application/vnd.ms-excel')
-        response['Content-Disposition'] = (
-            'attachment; filename="list_ingredients.xls"')
-        wb.save(response)
+        etag = (f'"{user.pk}-{user.shopping_cart_version}-'
+                f'{request.accepted_renderer.format}"')
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            rows = ShoppingListItem.objects.filter(
+                user=user, amount__gt=0).order_by(
+                    'ingredient__name',
+                    'ingredient__measurement_unit').values_list(
+                        'ingredient__name', 'ingredient__measurement_unit',
+                        'amount').iterator()
+            response = shopping_list_response(request.accepted_renderer,
+                                              rows)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ('Accept', 'Authorization'))
         return response
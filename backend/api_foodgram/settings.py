@@ -17,10 +17,80 @@ ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS',
 
 PAGE_SIZE = 6
 
+MAX_RECIPES_LIMIT = 50
+
+BULK_RECIPES_LIMIT = 100
+
+INGREDIENT_SEARCH_LIMIT = 50
+
+INGREDIENT_INDEX_CHECK_INTERVAL = float(
+    os.getenv('INGREDIENT_INDEX_CHECK_INTERVAL', default=5))
+
+REFERENCE_DATA_MAX_AGE = int(os.getenv('REFERENCE_DATA_MAX_AGE', default=60))
+
+REFERENCE_DATA_CACHE_TIMEOUT = 60 * 60 * 24
+
+RECIPE_LIST_CACHE_TIMEOUT = int(
+    os.getenv('RECIPE_LIST_CACHE_TIMEOUT', default=60))
+
 IMAGE_DIRECTORY = 'recipes/images/'
 
+IMAGE_THUMBNAIL_DIRECTORY = 'recipes/thumbnails/'
+
+IMAGE_MAX_SIZE = 1600
+
+IMAGE_QUALITY = 85
+
+IMAGE_FORMAT = 'WEBP'
+
+IMAGE_THUMBNAIL_SIZES = {'small': 320, 'medium': 640}
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
+
+IMAGE_UPLOAD_MAX_SIZE = int(
+    os.getenv('IMAGE_UPLOAD_MAX_SIZE', default=10 * 1024 * 1024))
+
+IMAGE_UPLOAD_MAX_PIXELS = int(
+    os.getenv('IMAGE_UPLOAD_MAX_PIXELS', default=25_000_000))
+
 STRING_OUTPUT_LENGTH = 30
 
+# Рецепты авторов с этим числом подписчиков и более не рассылаются по
+# лентам, а выбираются при чтении ленты.
+FEED_PULL_FOLLOWERS = int(os.getenv('FEED_PULL_FOLLOWERS', default=1000))
+
+# Сколько последних рецептов автора попадает в ленту при подписке.
+FEED_BACKFILL = int(os.getenv('FEED_BACKFILL', default=50))
+
+# Похожие рецепты: по умолчанию в ответе и кандидатов из индекса LSH,
+# которые сравниваются точно.
+SIMILAR_RECIPES_LIMIT = 6
+SIMILAR_CANDIDATES = int(os.getenv('SIMILAR_CANDIDATES', default=200))
+
+# Доля запросов, для которых замеряется SQL (Server-Timing db, лог N+1).
+REQUEST_PROFILING_SAMPLE_RATE = float(
+    os.getenv('REQUEST_PROFILING_SAMPLE_RATE', default=1.0))
+
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', default=500))
+
+N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', default=10))
+
+SLOW_REQUEST_TOP_QUERIES = 5
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', default='True') == 'True'
+
+# Каталог снимков метрик процессов, без него /internal/metrics/ отдает
+# метрики только обслужившего запрос процесса.
+METRICS_DIR = os.getenv('METRICS_DIR', default='')
+
+METRICS_FLUSH_INTERVAL = float(
+    os.getenv('METRICS_FLUSH_INTERVAL', default=1.0))
+
+METRICS_ALLOWED_NETWORKS = os.getenv(
+    'METRICS_ALLOWED_NETWORKS',
+    default='127.0.0.0/8,::1/128,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16'
+).split(',')
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -37,6 +107,7 @@ INSTALLED_APPS = [
     'colorfield',
     'users.apps.UsersConfig',
     'recipes.apps.RecipesConfig',
+    'api.apps.ApiConfig',
 ]
 
 
@@ -48,6 +119,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.RequestProfilingMiddleware',
 ]
 
 
@@ -101,6 +173,7 @@ else:
             'PORT': os.getenv('DB_PORT', 5432),
         }
     }
+    INSTALLED_APPS.append('django.contrib.postgres')
 
 
 # Static files (CSS, JavaScript, Images)
@@ -148,6 +221,27 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
 
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'performance': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'api.performance': {
+            'handlers': ['performance'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'api.permissions.IsOwnerOrAdminOrReadOnly',
@@ -3,9 +3,12 @@ from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
 
+from api.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    path('internal/metrics/', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
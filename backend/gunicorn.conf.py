@@ -0,0 +1,18 @@
+"""Настройки gunicorn, файл читается из рабочего каталога при запуске."""
+import os
+import shutil
+
+from api.metrics import archive
+
+
+def on_starting(server):
+    """Снимки метрик прошлого запуска удаляются."""
+    directory = os.getenv('METRICS_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def child_exit(server, worker):
+    directory = os.getenv('METRICS_DIR')
+    if directory:
+        archive(directory, worker.pid)
@@ -1,6 +1,9 @@
 from django.contrib import admin
 
 from recipes.models import Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag
+from recipes.shopping_cart import (recipe_ingredient_amounts,
+                                   update_shopping_lists)
+from recipes.similarity import index_recipes
 
 admin.site.empty_value_display = '-empty'
 
@@ -42,6 +45,7 @@ class RecipeAdmin(admin.ModelAdmin):
     list_display = (
         'name',
         'author',
+        'favorites_count',
     )
     search_fields = ('name',)
     list_filter = ('author', 'name', 'tags')
@@ -52,6 +56,10 @@ class RecipeAdmin(admin.ModelAdmin):
               'cooking_time',
               'favorites_count')
 
-    @admin.display(description='Добавили в избранное:')
-    def favorites_count(self, obj):
-        return obj.favorit_recipe.all().count()
+    def save_related(self, request, form, formsets, change):
+        old_amounts = (recipe_ingredient_amounts(form.instance)
+                       if change else {})
+        super().save_related(request, form, formsets, change)
+        if change:
+            update_shopping_lists(form.instance, old_amounts)
+        index_recipes([form.instance.pk])
@@ -0,0 +1,51 @@
+"""Вставка строк пачками в обход моделей и сигналов: на PostgreSQL - COPY
+во временную таблицу и один INSERT ... SELECT, на SQLite - executemany.
+"""
+import csv
+import io
+
+from django.db import connection
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def _copy_rows(table, columns, rows, conflict):
+    staging = _quote(f'import_{table}')
+    column_list = ', '.join(_quote(column) for column in columns)
+    buffer = io.StringIO()
+    # Строки в кавычках: пустая строка в CSV без кавычек - это NULL.
+    csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows(rows)
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE {staging} AS '
+            f'SELECT {column_list} FROM {_quote(table)} WITH NO DATA')
+        cursor.copy_expert(
+            f'COPY {staging} ({column_list}) FROM STDIN WITH (FORMAT csv)',
+            buffer)
+        cursor.execute(
+            f'INSERT INTO {_quote(table)} ({column_list}) '
+            f'SELECT {column_list} FROM {staging} {conflict}')
+        written = cursor.rowcount
+        cursor.execute(f'DROP TABLE {staging}')
+    return written
+
+
+def insert_rows(model, columns, rows, conflict='ON CONFLICT DO NOTHING'):
+    """Вставка rows (кортежей значений columns) в таблицу model с
+    обработкой конфликтов conflict. Возвращает число записанных строк."""
+    if not rows:
+        return 0
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        return _copy_rows(table, columns, rows, conflict)
+    column_list = ', '.join(_quote(column) for column in columns)
+    placeholders = ', '.join(['%s'] * len(columns))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {_quote(table)} ({column_list}) '
+            f'VALUES ({placeholders}) {conflict}',
+            rows)
+        return cursor.rowcount
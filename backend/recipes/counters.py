@@ -0,0 +1,47 @@
+"""Денормализованные счетчики: избранное у рецептов, рецепты и подписчики
+у пользователей.
+
+Счетчики меняются атомарно выражениями F() из сигналов (в том числе при
+каскадном удалении), массовые операции в обход сигналов вызывают
+change_counter явно. Расхождения исправляет команда recount_counters.
+"""
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe
+from users.models import Follow, User
+
+# Модель со счетчиком, поле счетчика, считаемая модель, внешний ключ.
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'following'),
+)
+
+
+def change_counter(model, field, pks, delta):
+    """Изменение счетчика field у объектов model с pk из pks на delta."""
+    queryset = model.objects.filter(pk__in=pks)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def recount_counters(repair=True):
+    """Пересчет всех счетчиков. Возвращает число расхождений для каждого
+    счетчика, при repair=True исправляет их."""
+    drift = {}
+    for model, field, counted_model, foreign_key in COUNTERS:
+        actual = Coalesce(Subquery(
+            counted_model.objects.filter(
+                **{foreign_key: OuterRef('pk')}).order_by().values(
+                    foreign_key).annotate(total=Count('pk')).values(
+                        'total')), Value(0))
+        drifted = model.objects.annotate(actual=actual).exclude(
+            **{field: F('actual')})
+        label = f'{model._meta.model_name}.{field}'
+        drift[label] = drifted.count()
+        if repair and drift[label]:
+            model.objects.filter(pk__in=drifted.values('pk')).update(
+                **{field: actual})
+    return drift
@@ -0,0 +1,143 @@
+"""Лента рецептов авторов, на которых подписан пользователь.
+
+Рецепты рассылаются по лентам (TimelineEntry): при публикации рецепт
+записывается всем подписчикам автора одним INSERT ... SELECT, при подписке
+в ленту добавляются последние FEED_BACKFILL рецептов автора, при отписке
+они удаляются. Авторы с FEED_PULL_FOLLOWERS и более подписчиками
+(User.feed_pull) рецепты не рассылают: их рецепты выбираются при чтении
+ленты отдельным запросом и сливаются с ней. В рассылку автор возвращается,
+когда подписчиков становится меньше половины порога, и в ленты
+подписчиков добавляются его последние рецепты и все рецепты,
+опубликованные после перевода на чтение (User.feed_pull_since).
+
+Страница ленты - два запроса по индексам, независимо от числа подписок.
+Массовые операции в обход сигналов вызывают push_recipes или
+rebuild_timelines явно.
+"""
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, Case, Q, Value, When
+from django.db.models.functions import Now
+
+from recipes.models import Recipe, TimelineEntry
+from users.models import Follow, User
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def push_recipes(recipe_ids):
+    """Рассылка рецептов recipe_ids подписчикам авторов без feed_pull."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {_table(TimelineEntry)} '
+            f'(user_id, recipe_id, pub_date) '
+            f'SELECT f.user_id, r.id, r.pub_date '
+            f'FROM {_table(Recipe)} r '
+            f'JOIN {_table(User)} a ON a.id = r.author_id '
+            f'JOIN {_table(Follow)} f ON f.following_id = r.author_id '
+            f'WHERE r.id IN ({placeholders}) AND a.feed_pull = %s '
+            f'ON CONFLICT DO NOTHING',
+            [*recipe_ids, False])
+
+
+def _backfill(user_id=None, author_id=None, since=None):
+    """Последние FEED_BACKFILL рецептов авторов без feed_pull, а при since
+    и все рецепты, опубликованные начиная с since, в ленты подписчиков.
+    user_id и author_id ограничивают подписки."""
+    conditions, params = ['a.feed_pull = %s'], [False]
+    if author_id is not None:
+        conditions.append('r.author_id = %s')
+        params.append(author_id)
+    follow_conditions = ['latest.number <= %s']
+    follow_params = [settings.FEED_BACKFILL]
+    if since is not None:
+        follow_conditions = ['(latest.number <= %s OR latest.pub_date >= %s)']
+        follow_params.append(connection.ops.adapt_datetimefield_value(since))
+    if user_id is not None:
+        follow_conditions.append('f.user_id = %s')
+        follow_params.append(user_id)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {_table(TimelineEntry)} '
+            f'(user_id, recipe_id, pub_date) '
+            f'SELECT f.user_id, latest.id, latest.pub_date FROM ('
+            f'SELECT r.id, r.author_id, r.pub_date, ROW_NUMBER() OVER ('
+            f'PARTITION BY r.author_id ORDER BY r.pub_date DESC, r.id DESC'
+            f') AS number FROM {_table(Recipe)} r '
+            f'JOIN {_table(User)} a ON a.id = r.author_id '
+            f'WHERE {" AND ".join(conditions)}) latest '
+            f'JOIN {_table(Follow)} f ON f.following_id = latest.author_id '
+            f'WHERE {" AND ".join(follow_conditions)} '
+            f'ON CONFLICT DO NOTHING',
+            [*params, *follow_params])
+
+
+def forget_author(user_id, author_id):
+    """Удаление рецептов автора из ленты пользователя."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id).delete()
+
+
+def follow_added(user_id, author_id):
+    """Подписка: автор, набравший FEED_PULL_FOLLOWERS подписчиков,
+    переводится на чтение, иначе его рецепты добавляются в ленту."""
+    User.objects.filter(
+        pk=author_id, feed_pull=False,
+        followers_count__gte=settings.FEED_PULL_FOLLOWERS).update(
+            feed_pull=True, feed_pull_since=Now())
+    _backfill(user_id=user_id, author_id=author_id)
+
+
+def follow_removed(user_id, author_id):
+    """Отписка: рецепты автора удаляются из ленты. Автор с числом
+    подписчиков меньше половины порога возвращается в рассылку, рецепты
+    за время чтения добавляются в ленты подписчиков."""
+    forget_author(user_id, author_id)
+    if User.objects.filter(
+            pk=author_id, feed_pull=True,
+            followers_count__lt=settings.FEED_PULL_FOLLOWERS // 2).update(
+                feed_pull=False):
+        # feed_pull_since остается до следующего перевода на чтение. Без
+        # отметки (перевод до ее появления) - все рецепты автора.
+        since = User.objects.filter(pk=author_id).values_list(
+            'feed_pull_since', flat=True).first()
+        _backfill(author_id=author_id,
+                  since=since or datetime.min.replace(tzinfo=timezone.utc))
+
+
+def rebuild_timelines():
+    """Пересчет feed_pull всех авторов и построение всех лент заново."""
+    pull = Q(followers_count__gte=settings.FEED_PULL_FOLLOWERS)
+    User.objects.update(
+        feed_pull=Case(When(pull, then=Value(True)), default=Value(False),
+                       output_field=BooleanField()),
+        feed_pull_since=Case(When(pull, then=Now()), default=None))
+    TimelineEntry.objects.all().delete()
+    _backfill()
+
+
+def feed_page(user_id, limit, before=None):
+    """Не более limit рецептов ленты пользователя, опубликованных раньше
+    before = (pub_date, id): [(pub_date, id)] от новых к старым."""
+    timeline = TimelineEntry.objects.filter(user_id=user_id)
+    pulled = Recipe.objects.filter(author__in=Follow.objects.filter(
+        user_id=user_id, following__feed_pull=True).values('following'))
+    if before is not None:
+        pub_date, pk = before
+        timeline = timeline.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, recipe__lt=pk))
+        pulled = pulled.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, pk__lt=pk))
+    rows = set(timeline.order_by('-pub_date', '-recipe').values_list(
+        'pub_date', 'recipe')[:limit])
+    rows.update(pulled.order_by('-pub_date', '-pk').values_list(
+        'pub_date', 'pk')[:limit])
+    return sorted(rows, reverse=True)[:limit]
@@ -0,0 +1,133 @@
+"""Обработка изображений рецептов.
+
+Загруженное изображение нормализуется при сохранении: поворот по EXIF,
+ограничение размеров IMAGE_MAX_SIZE, перекодирование в IMAGE_FORMAT (WebP,
+если Pillow собран без него - JPEG) без метаданных. Уменьшенные копии
+IMAGE_THUMBNAIL_SIZES строятся в пуле потоков после фиксации транзакции и
+записываются в Recipe.thumbnails, команда generate_thumbnails строит их для
+уже загруженных изображений.
+"""
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps, features
+
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS,
+                              thread_name_prefix='thumbnails')
+pending = set()
+
+
+def image_format():
+    if settings.IMAGE_FORMAT == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return settings.IMAGE_FORMAT
+
+
+def encode(image, max_size):
+    """Уменьшение image до max_size по большей стороне, поворот по EXIF и
+    кодирование без метаданных. Исходное изображение не копируется."""
+    image_type = image_format()
+    scale = max_size / max(image.size)
+    if scale < 1:
+        image = image.resize(
+            (max(1, round(image.width * scale)),
+             max(1, round(image.height * scale))),
+            Image.Resampling.LANCZOS, reducing_gap=3.0)
+    # Поворот после уменьшения: EXIF копируется в уменьшенное изображение.
+    image = ImageOps.exif_transpose(image)
+    if image_type == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    buffer = BytesIO()
+    image.save(buffer, image_type, quality=settings.IMAGE_QUALITY)
+    return buffer.getvalue(), image_type.lower().replace('jpeg', 'jpg')
+
+
+def normalize_image(file):
+    """Нормализованная копия загруженного изображения для сохранения."""
+    file.seek(0)
+    with Image.open(file) as image:
+        # JPEG декодируется сразу в уменьшенном масштабе, не меньше
+        # IMAGE_MAX_SIZE по большей стороне.
+        scale = min(1, settings.IMAGE_MAX_SIZE / max(image.size))
+        image.draft('RGB', (round(image.width * scale),
+                            round(image.height * scale)))
+        content, extension = encode(image, settings.IMAGE_MAX_SIZE)
+    return ContentFile(content, name=f'{uuid.uuid4().hex}.{extension}')
+
+
+def generate_thumbnails(name):
+    """Построение уменьшенных копий изображения name в хранилище:
+    {'source': name, размер: путь}."""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    directory = settings.IMAGE_THUMBNAIL_DIRECTORY
+    variants = {'source': name}
+    with default_storage.open(name) as file, Image.open(file) as image:
+        for size, max_size in settings.IMAGE_THUMBNAIL_SIZES.items():
+            content, extension = encode(image, max_size)
+            path = f'{directory}{stem}_{size}.{extension}'
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            variants[size] = default_storage.save(path, ContentFile(content))
+    return variants
+
+
+def save_thumbnails(recipe_ids, variants):
+    """Запись копий рецептам, изображение которых с тех пор не менялось."""
+    return Recipe.objects.filter(
+        pk__in=recipe_ids, image=variants['source']).update(
+            thumbnails=variants)
+
+
+def build_thumbnails(recipe_id, name):
+    try:
+        save_thumbnails([recipe_id], generate_thumbnails(name))
+    except Exception:
+        logger.exception('Не удалось построить копии изображения %s', name)
+    finally:
+        connection.close()
+
+
+def schedule_thumbnails(recipe):
+    """Построение копий изображения рецепта в фоне после фиксации
+    транзакции, в которой оно сохранено."""
+    recipe_id, name = recipe.pk, recipe.image.name
+
+    def submit():
+        future = executor.submit(build_thumbnails, recipe_id, name)
+        pending.add(future)
+        future.add_done_callback(pending.discard)
+
+    transaction.on_commit(submit)
+
+
+def wait_for_thumbnails():
+    """Ожидание построения всех запланированных копий."""
+    wait(list(pending))
+
+
+def thumbnail_urls(recipe):
+    """URL копий изображения рецепта, для еще не построенных - URL
+    исходного изображения."""
+    if not recipe.image:
+        return {}
+    thumbnails = recipe.thumbnails or {}
+    if thumbnails.get('source') != recipe.image.name:
+        thumbnails = {}
+    return {
+        size: (default_storage.url(thumbnails[size]) if size in thumbnails
+               else recipe.image.url)
+        for size in settings.IMAGE_THUMBNAIL_SIZES
+    }
@@ -0,0 +1,320 @@
+"""Потоковый импорт ингредиентов, тегов и рецептов.
+
+Записи читаются по одной из CSV, JSON (массив объектов) или NDJSON и
+записываются пачками в отдельных транзакциях: память не зависит от размера
+файла, прерванный импорт можно просто запустить снова. Импорт идемпотентен:
+ингредиенты не дублируются благодаря ограничению unique_ingredient, теги
+обновляются по slug, рецепты с тем же автором и названием пропускаются.
+
+На PostgreSQL пачка загружается COPY во временную таблицу и переносится
+одним INSERT ... SELECT ... ON CONFLICT, на SQLite - executemany с тем же
+ON CONFLICT. Сигналы не вызываются: счетчики рецептов авторов, ленты
+подписчиков и индекс похожих рецептов обновляются здесь явно, версии
+справочников увеличивает команда data_import, копии изображений строит
+команда generate_thumbnails.
+"""
+import csv
+import json
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.utils import timezone
+from PIL import UnidentifiedImageError
+
+from recipes.bulk import insert_rows
+from recipes.counters import change_counter
+from recipes.feed import push_recipes
+from recipes.images import normalize_image
+from recipes.models import Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag
+from recipes.similarity import index_recipes
+from users.models import User
+
+FORMATS = ('csv', 'json', 'ndjson')
+EXTENSIONS = {
+    '.csv': 'csv',
+    '.json': 'json',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+}
+JSON_CHUNK_SIZE = 64 * 1024
+NON_WHITESPACE = re.compile(r'\S')
+
+
+class RowError(ValueError):
+    """Запись, которую нельзя импортировать."""
+
+
+def detect_format(path):
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def read_csv(stream):
+    yield from csv.DictReader(stream)
+
+
+def read_ndjson(stream):
+    """Объекты по одному на строку. Вместо строки, которая не разбирается
+    как JSON, - RowError с ее номером: одна испорченная строка не
+    прерывает импорт."""
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            record = RowError(f'line {number}: invalid JSON: {error}')
+        yield record
+
+
+def read_json(stream):
+    """Объекты JSON-массива по одному, без чтения файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer, position = '', 0
+
+    def next_char():
+        nonlocal buffer, position
+        while True:
+            match = NON_WHITESPACE.search(buffer, position)
+            if match:
+                position = match.start()
+                return buffer[position]
+            buffer, position = stream.read(JSON_CHUNK_SIZE), 0
+            if not buffer:
+                return ''
+
+    if next_char() != '[':
+        raise ValueError('Expected a JSON array!')
+    position += 1
+    if next_char() == ']':
+        return
+    while True:
+        if not next_char():
+            raise ValueError('Unexpected end of a JSON array!')
+        while True:
+            try:
+                record, position = decoder.raw_decode(buffer, position)
+                break
+            except json.JSONDecodeError:
+                # Объект еще не прочитан до конца.
+                chunk = stream.read(JSON_CHUNK_SIZE)
+                if not chunk:
+                    raise
+                buffer, position = buffer[position:] + chunk, 0
+        yield record
+        char = next_char()
+        position += 1
+        if char == ']':
+            return
+        if char != ',':
+            raise ValueError('Expected "," or "]" in a JSON array!')
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+    'ndjson': read_ndjson,
+}
+
+
+def clean(model, field, value):
+    try:
+        return model._meta.get_field(field).clean(value, None)
+    except ValidationError as error:
+        raise RowError(f'{field}: {" ".join(error.messages)}')
+
+
+def get(record, field):
+    try:
+        return record[field]
+    except (KeyError, TypeError):
+        raise RowError(f'{field}: field is required')
+
+
+class IngredientImporter:
+    """Ингредиенты: name, measurement_unit."""
+    columns = ('name', 'measurement_unit')
+
+    def prepare(self, record):
+        return tuple(clean(Ingredient, column, get(record, column))
+                     for column in self.columns)
+
+    def write(self, rows):
+        return insert_rows(
+            Ingredient, self.columns, rows,
+            'ON CONFLICT (name, measurement_unit) DO NOTHING'), []
+
+
+class TagImporter:
+    """Теги: name, color, slug. У существующих тегов обновляются
+    название и цвет."""
+    columns = ('name', 'color', 'slug')
+
+    def prepare(self, record):
+        return tuple(clean(Tag, column, get(record, column))
+                     for column in self.columns)
+
+    def write(self, rows):
+        # ON CONFLICT DO UPDATE не может изменить строку дважды в одном
+        # запросе: из повторов slug в пачке остается последний.
+        rows = list({slug: (name, color, slug)
+                     for name, color, slug in rows}.values())
+        owners = dict(Tag.objects.filter(
+            name__in={name for name, _, _ in rows}).values_list(
+                'name', 'slug'))
+        accepted, errors = [], []
+        for name, color, slug in rows:
+            owner = owners.setdefault(name, slug)
+            if owner != slug:
+                errors.append(f'name: tag "{name}" already exists with '
+                              f'slug {owner}')
+            else:
+                accepted.append((name, color, slug))
+        return insert_rows(
+            Tag, self.columns, accepted,
+            'ON CONFLICT (slug) DO UPDATE '
+            'SET name = excluded.name, color = excluded.color'), errors
+
+
+class RecipeImporter:
+    """Рецепты: author (username), name, text, cooking_time, image,
+    tags (список slug) и ingredients (список объектов name,
+    measurement_unit, amount). В CSV tags и ingredients - JSON-строки.
+
+    Недостающие ингредиенты создаются. image обязателен: путь в
+    хранилище, а с images_dir - файл в этом каталоге, который
+    нормализуется и сохраняется в хранилище.
+    """
+    columns = ('author_id', 'name', 'text', 'cooking_time', 'image',
+               'pub_date', 'favorites_count', 'thumbnails')
+
+    def __init__(self, images_dir=None):
+        self.images_dir = images_dir
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+
+    def prepare(self, record):
+        tags, ingredients = get(record, 'tags'), get(record, 'ingredients')
+        try:
+            if isinstance(tags, str):
+                tags = json.loads(tags)
+            if isinstance(ingredients, str):
+                ingredients = json.loads(ingredients)
+        except ValueError:
+            raise RowError('tags and ingredients must be JSON lists')
+        if not isinstance(tags, list) or not isinstance(ingredients, list):
+            raise RowError('tags and ingredients must be lists')
+        if not tags or not ingredients:
+            raise RowError('tags and ingredients must not be empty')
+        image = get(record, 'image')
+        if not isinstance(image, str) or not image.strip():
+            raise RowError('image: must be a non-empty path')
+        unknown = [slug for slug in tags if slug not in self.tags]
+        if unknown:
+            raise RowError(f'tags: unknown slugs {unknown}')
+        amounts = {}
+        for ingredient in ingredients:
+            key = tuple(clean(Ingredient, field, get(ingredient, field))
+                        for field in IngredientImporter.columns)
+            amounts[key] = clean(RecipeIngredient, 'amount',
+                                 get(ingredient, 'amount'))
+        return {
+            'author': str(get(record, 'author')),
+            'name': clean(Recipe, 'name', get(record, 'name')),
+            'text': clean(Recipe, 'text', get(record, 'text')),
+            'cooking_time': clean(Recipe, 'cooking_time',
+                                  get(record, 'cooking_time')),
+            'image': image.strip(),
+            'tags': {self.tags[slug] for slug in tags},
+            'amounts': amounts,
+        }
+
+    def save_image(self, name):
+        with open(os.path.join(self.images_dir, name), 'rb') as file:
+            content = normalize_image(file)
+        return default_storage.save(
+            f'{settings.IMAGE_DIRECTORY}{content.name}', content)
+
+    def ingredient_ids(self, keys):
+        """id ингредиентов по (name, measurement_unit), недостающие
+        создаются."""
+        insert_rows(Ingredient, IngredientImporter.columns, list(keys),
+                    'ON CONFLICT (name, measurement_unit) DO NOTHING')
+        return {
+            (name, unit): pk
+            for pk, name, unit in Ingredient.objects.filter(
+                name__in={name for name, _ in keys}).values_list(
+                    'id', 'name', 'measurement_unit')}
+
+    def write(self, rows):
+        authors = dict(User.objects.filter(
+            username__in={row['author'] for row in rows}).values_list(
+                'username', 'id'))
+        existing = set(Recipe.objects.filter(
+            author_id__in=authors.values(),
+            name__in={row['name'] for row in rows}).values_list(
+                'author_id', 'name'))
+        recipes, errors = {}, []
+        for row in rows:
+            key = (authors.get(row['author']), row['name'])
+            if key[0] is None:
+                errors.append(f'author: unknown user {row["author"]}')
+            elif key not in existing:
+                recipes.setdefault(key, row)
+        if not recipes:
+            return 0, errors
+
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        values = []
+        for (author_id, name), row in list(recipes.items()):
+            image = row['image']
+            if self.images_dir:
+                try:
+                    image = self.save_image(image)
+                except (OSError, UnidentifiedImageError) as error:
+                    errors.append(f'image: {error}')
+                    del recipes[author_id, name]
+                    continue
+            values.append((author_id, name, row['text'], row['cooking_time'],
+                           image, now, 0, '{}'))
+        insert_rows(Recipe, self.columns, values)
+        recipe_ids = {
+            (author_id, name): pk
+            for pk, author_id, name in Recipe.objects.filter(
+                author_id__in={author_id for author_id, _ in recipes},
+                name__in={name for _, name in recipes}).values_list(
+                    'id', 'author_id', 'name')
+            if (author_id, name) in recipes}
+
+        ingredient_ids = self.ingredient_ids(
+            {key for row in recipes.values() for key in row['amounts']})
+        insert_rows(
+            RecipeIngredient, ('recipe_id', 'ingredient_id', 'amount'), [
+                (recipe_ids[key], ingredient_ids[ingredient], amount)
+                for key, row in recipes.items()
+                for ingredient, amount in row['amounts'].items()])
+        insert_rows(RecipeTag, ('recipe_id', 'tag_id'), [
+            (recipe_ids[key], tag_id)
+            for key, row in recipes.items() for tag_id in row['tags']])
+
+        # Авторы с одинаковым числом новых рецептов - одним запросом.
+        created = {}
+        for author_id, _ in recipes:
+            created[author_id] = created.get(author_id, 0) + 1
+        by_count = {}
+        for author_id, count in created.items():
+            by_count.setdefault(count, []).append(author_id)
+        for count, author_ids in by_count.items():
+            change_counter(User, 'recipes_count', author_ids, count)
+        push_recipes(recipe_ids.values())
+        index_recipes(recipe_ids.values())
+        return len(recipes), errors
+
+
+IMPORTERS = {
+    'ingredients': IngredientImporter,
+    'tags': TagImporter,
+    'recipes': RecipeImporter,
+}
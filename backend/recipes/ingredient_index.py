@@ -0,0 +1,92 @@
+"""Индекс названий ингредиентов в памяти процесса для автодополнения.
+
+Названия нормализуются (casefold, ё -> е) и хранятся отсортированными,
+поиск по префиксу - двоичный поиск и проход по соседним элементам.
+Индекс строится при старте воркера и перестраивается, когда меняется
+версия справочника ингредиентов: ее увеличивают сигналы и массовые
+операции в любом процессе. Версия проверяется одним запросом не чаще
+раза в INGREDIENT_INDEX_CHECK_INTERVAL секунд, поэтому поиск обычно
+обходится без БД; изменения в этом процессе сбрасывают индекс сразу после
+фиксации транзакции.
+"""
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from recipes.models import Ingredient
+from recipes.reference_data import INGREDIENTS, get_versions
+
+
+def normalize(value):
+    return value.casefold().replace('ё', 'е')
+
+
+class IngredientIndex:
+    """Отсортированный индекс нормализованных названий ингредиентов."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = 0.0
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def build(self, version=None):
+        # Версия читается до названий: изменение между ними приведет
+        # к лишнему перестроению, а не к устаревшему индексу.
+        if version is None:
+            version = get_versions((INGREDIENTS, ))[INGREDIENTS]
+        rows = sorted(
+            ({'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+             for pk, name, measurement_unit in Ingredient.objects.values_list(
+                 'id', 'name', 'measurement_unit')),
+            key=lambda row: (normalize(row['name']), row['name'], row['id']))
+        keys = [normalize(row['name']) for row in rows]
+        self._snapshot = (version, keys, rows)
+        self._checked_at = time.monotonic()
+        return self._snapshot
+
+    def _get_snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is not None and (
+                time.monotonic() - self._checked_at
+                < settings.INGREDIENT_INDEX_CHECK_INTERVAL):
+            return snapshot
+        version = get_versions((INGREDIENTS, ))[INGREDIENTS]
+        if snapshot is not None and snapshot[0] == version:
+            self._checked_at = time.monotonic()
+            return snapshot
+        with self._lock:
+            if self._snapshot is snapshot:
+                return self.build(version)
+            return self._snapshot
+
+    def search(self, prefix, limit):
+        """Не более limit ингредиентов, название которых начинается
+        с prefix, в алфавитном порядке."""
+        _, keys, rows = self._get_snapshot()
+        prefix = normalize(prefix)
+        start = bisect.bisect_left(keys, prefix)
+        result = []
+        for key, row in zip(keys[start:start + limit],
+                            rows[start:start + limit]):
+            if not key.startswith(prefix):
+                break
+            result.append(row)
+        return result
+
+    def warm_up(self):
+        """Построение индекса при старте воркера. Ошибки БД (например,
+        до применения миграций) откладывают построение до первого
+        запроса."""
+        try:
+            self.build()
+        except DatabaseError:
+            self.invalidate()
+
+
+ingredient_index = IngredientIndex()
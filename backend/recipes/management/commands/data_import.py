@@ -1,28 +1,120 @@
-import csv
-from io import open
-
-from django.core.management.base import BaseCommand
+import io
+import sys
+import time
 
 from django.conf import settings
-from recipes.models import Ingredient
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, transaction
+
+from recipes.importer import (FORMATS, IMPORTERS, READERS, RecipeImporter,
+                              RowError, detect_format)
+from recipes.reference_data import INGREDIENTS, RECIPES, TAGS, bump_version
+
+# Справочники, которые меняет импорт каждого типа.
+VERSIONS = {
+    'ingredients': (INGREDIENTS, ),
+    'tags': (TAGS, ),
+    'recipes': (RECIPES, INGREDIENTS),
+}
+# Сколько ошибок в записях выводить.
+MAX_REPORTED_ERRORS = 20
+# Интервал вывода прогресса, с.
+PROGRESS_INTERVAL = 1
 
 
 class Command(BaseCommand):
-    help = 'Import ingredients to DB'
+    help = ('Потоковый идемпотентный импорт ингредиентов, тегов или рецептов '
+            'из CSV, JSON или NDJSON (файл или stdin) пачками.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=str(settings.BASE_DIR / 'recipes/data/ingredients.csv'),
+            help='Путь к файлу, "-" - stdin. По умолчанию - ингредиенты '
+                 'проекта.')
+        parser.add_argument(
+            '--type', choices=IMPORTERS, default='ingredients',
+            help='Что импортировать.')
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Формат данных, по умолчанию - по расширению файла.')
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help='Записей в одной пачке (транзакции).')
+        parser.add_argument(
+            '--images-dir',
+            help='Каталог с изображениями рецептов: image - имя файла в '
+                 'нем. Без него image - путь в хранилище.')
 
     def handle(self, *args, **options):
+        path = options['path']
+        data_format = options['format'] or (
+            None if path == '-' else detect_format(path))
+        if data_format is None:
+            raise CommandError('Укажите формат данных: --format.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным.')
+        importer_class = IMPORTERS[options['type']]
+        importer = (importer_class(options['images_dir'])
+                    if importer_class is RecipeImporter else importer_class())
 
-        with open(settings.BASE_DIR / 'recipes/data/ingredients.csv',
-                  encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            ingredients = []
-            for row in reader:
-                ingredients.append(Ingredient(
-                    name=row['name'],
-                    measurement_unit=row['measurement_unit']))
+        if path == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8',
+                                      newline='')
+        else:
+            try:
+                stream = open(path, encoding='utf-8', newline='')
+            except OSError as error:
+                raise CommandError(error)
+        with stream:
             try:
-                Ingredient.objects.bulk_create(ingredients,
-                                               ignore_conflicts=True)
-            except ImportError:
-                print('Что-то пошло не так')
-        print('Данные импортированы!')
+                stats = self.run(importer, READERS[data_format](stream),
+                                 options['batch_size'])
+            except (ValueError, DatabaseError) as error:
+                raise CommandError(f'Импорт прерван: {error}')
+            finally:
+                bump_version(*VERSIONS[options['type']])
+
+        self.stdout.write(self.style.SUCCESS(
+            'Данные импортированы! ' + self.format_stats(stats)))
+
+    def run(self, importer, records, batch_size):
+        stats = {'read': 0, 'written': 0, 'invalid': 0,
+                 'started': time.monotonic(), 'progress_at': 0}
+        batch = []
+        for stats['read'], record in enumerate(records, 1):
+            try:
+                if isinstance(record, RowError):
+                    raise record
+                batch.append(importer.prepare(record))
+            except RowError as error:
+                self.report_error(stats, f'Запись {stats["read"]}: {error}')
+            if len(batch) >= batch_size:
+                self.write(importer, batch, stats)
+                batch = []
+        self.write(importer, batch, stats)
+        return stats
+
+    def write(self, importer, batch, stats):
+        if not batch:
+            return
+        with transaction.atomic():
+            written, errors = importer.write(batch)
+        stats['written'] += written
+        for error in errors:
+            self.report_error(stats, error)
+        now = time.monotonic()
+        if now - stats['progress_at'] >= PROGRESS_INTERVAL:
+            stats['progress_at'] = now
+            self.stdout.write(self.format_stats(stats))
+
+    def report_error(self, stats, message):
+        stats['invalid'] += 1
+        if stats['invalid'] <= MAX_REPORTED_ERRORS:
+            self.stderr.write(message)
+
+    def format_stats(self, stats):
+        elapsed = time.monotonic() - stats['started']
+        return (f'прочитано: {stats["read"]}, записано: {stats["written"]}, '
+                f'с ошибками: {stats["invalid"]}, {elapsed:.1f} с, '
+                f'{stats["read"] / max(elapsed, 1e-6):.0f} записей/с')
@@ -0,0 +1,80 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from recipes.synthetic import generate_dataset
+
+# Интервал вывода прогресса, с.
+PROGRESS_INTERVAL = 1
+
+
+class Command(BaseCommand):
+    help = ('Генерация синтетических данных заданного масштаба для '
+            'нагрузочного тестирования: пользователи, подписки, рецепты, '
+            'избранное и корзины с распределением популярности по закону '
+            'Ципфа.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=1000,
+            help='Число пользователей.')
+        parser.add_argument(
+            '--recipes-per-user', type=int, default=5,
+            help='Рецептов на пользователя в среднем.')
+        parser.add_argument(
+            '--ingredients', type=int, default=2000,
+            help='Число ингредиентов.')
+        parser.add_argument(
+            '--tags', type=int, default=12,
+            help='Число тегов.')
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8,
+            help='Ингредиентов в рецепте в среднем.')
+        parser.add_argument(
+            '--follows-per-user', type=int, default=20,
+            help='Подписок пользователя в среднем.')
+        parser.add_argument(
+            '--favorites-per-user', type=int, default=10,
+            help='Избранных рецептов пользователя в среднем.')
+        parser.add_argument(
+            '--carts-per-user', type=int, default=3,
+            help='Рецептов в корзине пользователя в среднем.')
+        parser.add_argument(
+            '--exponent', type=float, default=1.1,
+            help='Показатель закона Ципфа: чем больше, тем сильнее '
+                 'популярность сосредоточена у немногих.')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Начальное значение генератора случайных чисел.')
+
+    def handle(self, *args, **options):
+        sizes = {key: options[key] for key in (
+            'users', 'recipes_per_user', 'ingredients', 'tags',
+            'ingredients_per_recipe', 'follows_per_user',
+            'favorites_per_user', 'carts_per_user')}
+        if options['users'] < 2 or options['tags'] < 1 or (
+                options['ingredients'] < 1):
+            raise CommandError(
+                'Нужны хотя бы два пользователя, один тег и один ингредиент.')
+        if any(value < 0 for value in sizes.values()):
+            raise CommandError('Размеры не могут быть отрицательными.')
+        started = time.monotonic()
+        shown = {'at': 0}
+
+        def progress(label, count):
+            now = time.monotonic()
+            if now - shown['at'] >= PROGRESS_INTERVAL:
+                shown['at'] = now
+                self.stdout.write(
+                    f'{label}: {count}, {now - started:.1f} с')
+
+        try:
+            counts = generate_dataset(
+                exponent=options['exponent'], seed=options['seed'],
+                progress=progress, **sizes)
+        except (ValueError, DatabaseError) as error:
+            raise CommandError(f'Генерация прервана: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные сгенерированы за {time.monotonic() - started:.1f} с! '
+            + ', '.join(f'{key}: {value}' for key, value in counts.items())))
@@ -0,0 +1,50 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from recipes.images import generate_thumbnails, save_thumbnails
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Построение уменьшенных копий загруженных изображений рецептов '
+            'в нескольких процессах.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов, по умолчанию - число ядер.')
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Перестроить копии и для рецептов, у которых они есть.')
+
+    def handle(self, *args, **options):
+        pending = defaultdict(list)
+        for pk, image, thumbnails in Recipe.objects.exclude(
+                image='').values_list('id', 'image', 'thumbnails').iterator():
+            if options['force'] or thumbnails.get('source') != image:
+                pending[image].append(pk)
+        self.stdout.write(f'Изображений без копий: {len(pending)}')
+
+        # Соединения с БД не должны наследоваться процессами пула.
+        connections.close_all()
+        updated = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'],
+                                 initializer=django.setup) as pool:
+            futures = {pool.submit(generate_thumbnails, image): image
+                       for image in pending}
+            for future in as_completed(futures):
+                image = futures[future]
+                try:
+                    variants = future.result()
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'{image}: {error}')
+                    continue
+                updated += save_thumbnails(pending[image], variants)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено рецептов: {updated}, ошибок: {failed}'))
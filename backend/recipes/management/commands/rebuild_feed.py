@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.feed import rebuild_timelines
+from recipes.models import TimelineEntry
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Построение лент подписок заново: рассылка рецептов или чтение '
+            'при запросе по числу подписчиков автора (FEED_PULL_FOLLOWERS).')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_timelines()
+        self.stdout.write(self.style.SUCCESS(
+            f'Записей в лентах: {TimelineEntry.objects.count()}, авторов с '
+            f'чтением при запросе: '
+            f'{User.objects.filter(feed_pull=True).count()}.'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import RecipeBucket
+from recipes.similarity import rebuild_index
+
+
+class Command(BaseCommand):
+    help = ('Построение индекса похожих рецептов (корзин MinHash/LSH по '
+            'ингредиентам и тегам) заново.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recipes = rebuild_index(progress=lambda count: self.stdout.write(
+                f'Рецептов: {count}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Рецептов в индексе: {recipes}, корзин: '
+            f'{RecipeBucket.objects.count()}.'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from recipes.counters import recount_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчет счетчиков избранного, рецептов и подписчиков'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать расхождения, не исправляя их.')
+
+    def handle(self, *args, **options):
+        drift = recount_counters(repair=not options['dry_run'])
+        for label, count in drift.items():
+            self.stdout.write(f'{label}: расхождений {count}')
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Счетчики пересчитаны.'))
@@ -0,0 +1,133 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.benchmarks import benchmark_environment
+from recipes.models import Recipe, RecipeBucket, RecipeIngredient, RecipeTag
+from recipes.similarity import INGREDIENT, TAG, similar_recipes
+from recipes.synthetic import generate_dataset
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def exact_similar(recipe_id, limit):
+    """Точные похожие рецепты самосоединением признаков всех рецептов:
+    [(мера Жаккара, id)], как similar_recipes."""
+    features = (
+        f'SELECT recipe_id, ingredient_id * 2 + {INGREDIENT} AS feature '
+        f'FROM {_table(RecipeIngredient)} UNION ALL '
+        f'SELECT recipe_id, tag_id * 2 + {TAG} FROM {_table(RecipeTag)}')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'WITH features AS ({features}), '
+            f'own AS (SELECT feature FROM features WHERE recipe_id = %s), '
+            f'shared AS (SELECT f.recipe_id, COUNT(*) AS common '
+            f'FROM features f JOIN own ON own.feature = f.feature '
+            f'WHERE f.recipe_id <> %s GROUP BY f.recipe_id), '
+            f'sizes AS (SELECT recipe_id, COUNT(*) AS size FROM features '
+            f'WHERE recipe_id IN (SELECT recipe_id FROM shared) '
+            f'GROUP BY recipe_id) '
+            f'SELECT shared.recipe_id, shared.common, sizes.size, '
+            f'(SELECT COUNT(*) FROM own) FROM shared '
+            f'JOIN sizes ON sizes.recipe_id = shared.recipe_id',
+            [recipe_id, recipe_id])
+        rows = cursor.fetchall()
+    return sorted(((common / (size + own - common), pk)
+                   for pk, common, size, own in rows), reverse=True)[:limit]
+
+
+class Command(BaseCommand):
+    help = ('Похожие рецепты: индекс MinHash/LSH против точного '
+            'самосоединения ингредиентов и тегов всех рецептов. Время '
+            'запроса и полнота индекса - доля точных похожих с мерой '
+            'Жаккара не меньше --min-score, для которых индекс нашел рецепт с '
+            'не меньшей мерой.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=20000,
+            help='Число пользователей синтетических данных.')
+        parser.add_argument(
+            '--recipes-per-user', type=int, default=5,
+            help='Среднее число рецептов пользователя.')
+        parser.add_argument(
+            '--samples', type=int, default=30,
+            help='Число рецептов, для которых ищутся похожие.')
+        parser.add_argument(
+            '--limit', type=int, default=6,
+            help='Число похожих рецептов в ответе.')
+        parser.add_argument(
+            '--min-score', type=float, default=0.3,
+            help='Мера Жаккара, начиная с которой считается полнота.')
+        parser.add_argument(
+            '--max-ms', type=float,
+            help='Допустимая медиана времени запроса по индексу, мс.')
+        parser.add_argument(
+            '--output', help='Путь для отчета в формате JSON.')
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        timings = {'exact': [], 'index': []}
+        found = relevant = 0
+        with benchmark_environment():
+            started = time.perf_counter()
+            generate_dataset(users=options['users'],
+                             recipes_per_user=options['recipes_per_user'])
+            generate_s = time.perf_counter() - started
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+            recipe_ids = list(Recipe.objects.values_list('pk', flat=True))
+            for recipe_id in random.Random(0).sample(
+                    recipe_ids, min(options['samples'], len(recipe_ids))):
+                started = time.perf_counter()
+                exact = exact_similar(recipe_id, limit)
+                timings['exact'].append(time.perf_counter() - started)
+                started = time.perf_counter()
+                ranked = similar_recipes(recipe_id, limit)
+                timings['index'].append(time.perf_counter() - started)
+                # Место в ответе занято верно, если мера не ниже точной:
+                # рецепты с равной мерой взаимозаменяемы.
+                for position, (score, _) in enumerate(exact):
+                    if score < options['min_score']:
+                        break
+                    relevant += 1
+                    found += (position < len(ranked)
+                              and ranked[position][0] >= score - 1e-9)
+            recipes = len(recipe_ids)
+            buckets = RecipeBucket.objects.count()
+
+        report = {
+            'database': connection.vendor,
+            'recipes': recipes,
+            'buckets': buckets,
+            'generate_s': round(generate_s, 1),
+            'exact_ms': round(statistics.median(timings['exact']) * 1000, 2),
+            'index_ms': round(statistics.median(timings['index']) * 1000, 2),
+            'index_max_ms': round(max(timings['index']) * 1000, 2),
+            'recall': round(found / relevant, 3) if relevant else None,
+        }
+        self.stdout.write(
+            f'Рецептов: {recipes}, корзин: {buckets}, БД: '
+            f'{connection.vendor}, генерация с индексом: '
+            f'{report["generate_s"]} с\n'
+            f'медиана запроса: самосоединение {report["exact_ms"]} мс, '
+            f'индекс {report["index_ms"]} мс (максимум '
+            f'{report["index_max_ms"]} мс)\n'
+            f'полнота при мере от {options["min_score"]}: '
+            f'{report["recall"]} ({found} из {relevant})')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+        if (options['max_ms'] is not None
+                and report['index_ms'] > options['max_ms']):
+            raise CommandError(
+                f'Запрос по индексу {report["index_ms"]} мс, допустимо '
+                f'{options["max_ms"]} мс.')
+        self.stdout.write(self.style.SUCCESS('Бюджет соблюден.'))
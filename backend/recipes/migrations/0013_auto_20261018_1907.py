@@ -0,0 +1,44 @@
+# Generated by Django 3.2.16 on 2026-10-18 19:07
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    User = apps.get_model('users', 'User')
+    Follow = apps.get_model('users', 'Follow')
+    counters = (
+        (Recipe, 'favorites_count', Favorite, 'recipe'),
+        (User, 'recipes_count', Recipe, 'author'),
+        (User, 'followers_count', Follow, 'following'),
+    )
+    for model, field, counted_model, foreign_key in counters:
+        total = counted_model.objects.filter(
+            **{foreign_key: models.OuterRef('pk')}).order_by().values(
+                foreign_key).annotate(total=models.Count('pk')).values(
+                    'total')
+        model.objects.update(**{field: Coalesce(
+            models.Subquery(total), models.Value(0))})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_auto_20261018_1905'),
+        ('users', '0005_auto_20261018_1907'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавили в избранное'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count'], name='recipe_favorites_count_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
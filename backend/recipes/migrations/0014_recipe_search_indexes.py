@@ -0,0 +1,38 @@
+from django.db import migrations
+
+SEARCH_VECTOR = (
+    "(setweight(to_tsvector('russian'::regconfig, "
+    "COALESCE(\"name\", '')), 'A') || "
+    "setweight(to_tsvector('russian'::regconfig, "
+    "COALESCE(\"text\", '')), 'B'))"
+)
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS recipe_search_vector_idx '
+        f'ON recipes_recipe USING gin ({SEARCH_VECTOR})')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS recipe_name_trgm_idx '
+        'ON recipes_recipe USING gin (name gin_trgm_ops)')
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS recipe_search_vector_idx')
+    schema_editor.execute('DROP INDEX IF EXISTS recipe_name_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_auto_20261018_1907'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 3.2.16 on 2026-10-18 19:25
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicates(apps, schema_editor):
+    """Удаление повторов (user, recipe) с пересчетом затронутых счетчиков
+    избранного и списков покупок."""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    Cart = apps.get_model('recipes', 'Cart')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    affected = {}
+    for model in (Favorite, Cart):
+        duplicates = model.objects.values('user', 'recipe').annotate(
+            first=models.Min('id'), total=models.Count('id')).filter(
+                total__gt=1).order_by()
+        affected[model] = list(duplicates)
+        for row in affected[model]:
+            model.objects.filter(
+                user=row['user'], recipe=row['recipe']).exclude(
+                    id=row['first']).delete()
+
+    recipes = {row['recipe'] for row in affected[Favorite]}
+    total = Favorite.objects.filter(
+        recipe=models.OuterRef('pk')).order_by().values('recipe').annotate(
+            total=models.Count('pk')).values('total')
+    Recipe.objects.filter(pk__in=recipes).update(favorites_count=Coalesce(
+        models.Subquery(total), models.Value(0)))
+
+    users = {row['user'] for row in affected[Cart]}
+    ShoppingListItem.objects.filter(user__in=users).delete()
+    totals = Cart.objects.filter(user__in=users).values(
+        'user', 'recipe__recipe_ingredients__ingredient').annotate(
+            total=models.Sum('recipe__recipe_ingredients__amount'))
+    ShoppingListItem.objects.bulk_create(
+        (ShoppingListItem(
+            user_id=row['user'],
+            ingredient_id=row['recipe__recipe_ingredients__ingredient'],
+            amount=row['total'])
+         for row in totals.iterator()
+         if row['recipe__recipe_ingredients__ingredient'] is not None),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_recipe_thumbnails'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_cart'),
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+    ]
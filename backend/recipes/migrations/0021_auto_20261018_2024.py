@@ -0,0 +1,86 @@
+# Generated by Django 3.2.16 on 2026-10-18 20:24
+
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Хеширование заморожено на момент миграции: изменения recipes.similarity
+# не должны менять результат уже примененной миграции. После их изменения
+# индекс перестраивается командой rebuild_similar.
+BANDS = 32
+ROWS = 3
+PRIME = 2 ** 61 - 1
+INGREDIENT, TAG = 0, 1
+
+
+def _coefficient(name):
+    digest = hashlib.blake2b(name.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % (PRIME - 1) + 1
+
+
+COEFFICIENTS = [(_coefficient(f'a{index}'), _coefficient(f'b{index}'))
+                for index in range(BANDS * ROWS)]
+
+
+def feature(kind, pk):
+    return pk * 2 + kind
+
+
+def recipe_buckets(features, hashes):
+    signature = list(map(min, zip(*(
+        hashes.setdefault(feature, tuple(
+            (a * feature + b) % PRIME for a, b in COEFFICIENTS))
+        for feature in features))))
+    buckets = []
+    for band in range(BANDS):
+        values = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(
+            repr((band, values)).encode(), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, 'big', signed=True))
+    return buckets
+
+
+def fill_buckets(apps, schema_editor):
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    RecipeTag = apps.get_model('recipes', 'RecipeTag')
+    RecipeBucket = apps.get_model('recipes', 'RecipeBucket')
+    features, hashes = {}, {}
+    for kind, rows in (
+            (INGREDIENT, RecipeIngredient.objects.values_list(
+                'recipe_id', 'ingredient_id')),
+            (TAG, RecipeTag.objects.values_list('recipe_id', 'tag_id'))):
+        for recipe_id, pk in rows.iterator():
+            features.setdefault(recipe_id, set()).add(feature(kind, pk))
+    RecipeBucket.objects.bulk_create(
+        (RecipeBucket(recipe_id=recipe_id, bucket=bucket)
+         for recipe_id, recipe_features in features.items()
+         for bucket in recipe_buckets(recipe_features, hashes)),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0020_auto_20261018_2018'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.BigIntegerField(verbose_name='Корзина')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarity_buckets', to='recipes.recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'Корзина похожих рецептов',
+                'verbose_name_plural': 'Корзины похожих рецептов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipebucket',
+            index=models.Index(fields=['bucket', 'recipe'], name='recipe_bucket_bucket_idx'),
+        ),
+        migrations.RunPython(fill_buckets, migrations.RunPython.noop),
+    ]
@@ -93,6 +93,8 @@ class Recipe(models.Model):
     author = models.ForeignKey(
         User, related_name='recipes',
         on_delete=models.CASCADE,
+        # Индекс - recipe_author_pub_date_idx.
+        db_index=False,
         verbose_name='Автор'
     )
     tags = models.ManyToManyField(
@@ -106,11 +108,30 @@ class Recipe(models.Model):
         related_name='recipes',
     )
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        'Добавили в избранное',
+        default=0,
+        editable=False,
+    )
+    thumbnails = models.JSONField(
+        'Уменьшенные копии изображения',
+        default=dict,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=['-favorites_count'],
+                         name='recipe_favorites_count_idx'),
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+            # Рецепты автора в подписках и фильтре author по дате.
+            models.Index(fields=['author', '-pub_date'],
+                         name='recipe_author_pub_date_idx'),
+        ]
 
     def __str__(self) -> str:
         return f'{self.name[:settings.STRING_OUTPUT_LENGTH]}...'
@@ -118,8 +139,10 @@ class Recipe(models.Model):
 
 class RecipeTag(models.Model):
     """Связующая модель для рецептов и тегов."""
-    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
-    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+    # Индексы - unique_tag и recipe_tag_tag_recipe_idx.
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE,
+                               db_index=False)
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, db_index=False)
 
     class Meta:
         verbose_name = 'Тег рецепта'
@@ -128,6 +151,11 @@ class RecipeTag(models.Model):
             models.UniqueConstraint(
                 fields=['recipe', 'tag'], name='unique_tag')
         ]
+        indexes = [
+            # Фильтр по тегам: рецепты тега без обращения к таблице.
+            models.Index(fields=['tag', 'recipe'],
+                         name='recipe_tag_tag_recipe_idx'),
+        ]
 
     def __str__(self) -> str:
         return f'{self.recipe} tag - {self.tag}'
@@ -165,6 +193,8 @@ class Favorite(models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        # Индекс - уникальное ограничение (user, recipe).
+        db_index=False,
         related_name='users_favorits_recipe',
         verbose_name='Пользователь',
     )
@@ -178,6 +208,11 @@ class Favorite(models.Model):
     class Meta:
         verbose_name = 'Избранный рецепт'
         verbose_name_plural = 'Избранные рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_favorite')
+        ]
 
     def __str__(self) -> str:
         return f'{self.user} added to favorite - {self.recipe}'
@@ -188,6 +223,8 @@ class Cart(models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        # Индекс - уникальное ограничение (user, recipe).
+        db_index=False,
         related_name='carts_user',
         verbose_name='Корзина пользователя',
     )
@@ -201,6 +238,122 @@ class Cart(models.Model):
     class Meta:
         verbose_name = 'Рецепт в корзине'
         verbose_name_plural = 'Рецепты в корзине'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_cart')
+        ]
 
     def __str__(self) -> str:
         return f'{self.user} added to cart - {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    """Модель данных для суммарного количества ингредиента в корзине
+    пользователя. Обновляется при изменении корзины и рецептов в ней."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+    )
+    amount = models.IntegerField('Количество')
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item')
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.user} needs {self.amount} of {self.ingredient}'
+
+
+class TimelineEntry(models.Model):
+    """Модель данных для рецепта в ленте подписчика его автора.
+    Заполняется при публикации рецепта и подписке, см. recipes.feed."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        # Индекс - уникальное ограничение (user, recipe).
+        db_index=False,
+        related_name='timeline',
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт',
+    )
+    pub_date = models.DateTimeField('Дата публикации рецепта')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_timeline_entry')
+        ]
+        indexes = [
+            # Страница ленты по курсору (pub_date, id).
+            models.Index(fields=['user', '-pub_date', '-recipe'],
+                         name='timeline_user_pub_date_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.recipe} in feed of {self.user}'
+
+
+class RecipeBucket(models.Model):
+    """Модель данных для корзины LSH рецепта: хеш полосы его сигнатуры
+    MinHash по ингредиентам и тегам, см. recipes.similarity."""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similarity_buckets',
+        verbose_name='Рецепт',
+    )
+    bucket = models.BigIntegerField('Корзина')
+
+    class Meta:
+        verbose_name = 'Корзина похожих рецептов'
+        verbose_name_plural = 'Корзины похожих рецептов'
+        indexes = [
+            # Рецепты корзины без обращения к таблице.
+            models.Index(fields=['bucket', 'recipe'],
+                         name='recipe_bucket_bucket_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.recipe} in bucket {self.bucket}'
+
+
+class ReferenceDataVersion(models.Model):
+    """Модель данных для версии справочника (тегов, ингредиентов).
+    Версия увеличивается при любом изменении справочника и служит ключом
+    HTTP-кеширования и кеша сериализованных ответов."""
+    name = models.CharField(
+        'Справочник',
+        max_length=MAX_NAME_LENGTH,
+        unique=True,
+    )
+    version = models.PositiveIntegerField('Версия', default=0)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Версия справочника'
+        verbose_name_plural = 'Версии справочников'
+
+    def __str__(self) -> str:
+        return f'{self.name} v{self.version}'
@@ -0,0 +1,75 @@
+"""Версии справочников тегов и ингредиентов и каталога рецептов.
+
+Версия хранится в БД, поэтому ее изменение сразу видно всем воркерам.
+Сигналы Tag и Ingredient (справочники) и Recipe, RecipeIngredient,
+RecipeTag (каталог) откладывают увеличение версии до фиксации транзакции,
+так что изменение рецепта со всеми ингредиентами и тегами - это одно
+обновление версии. Массовые операции в обход сигналов вызывают
+bump_version явно.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from recipes.models import ReferenceDataVersion, Tag
+
+TAGS = 'tags'
+INGREDIENTS = 'ingredients'
+RECIPES = 'recipes'
+
+_pending = threading.local()
+
+
+def bump_version(*names):
+    """Увеличение версий справочников names."""
+    updated = ReferenceDataVersion.objects.filter(name__in=names).update(
+        version=F('version') + 1, updated_at=timezone.now())
+    if updated < len(names):
+        for name in names:
+            ReferenceDataVersion.objects.get_or_create(
+                name=name, defaults={'version': 1})
+
+
+def _flush_pending():
+    names = getattr(_pending, 'names', None)
+    if names:
+        _pending.names = set()
+        bump_version(*names)
+
+
+def bump_version_on_commit(name):
+    """Увеличение версии справочника name после фиксации транзакции.
+
+    Первый обработчик on_commit увеличивает все накопленные версии одним
+    запросом, остальные ничего не делают. После отката накопленные имена
+    увеличатся вместе со следующей транзакцией, что безопасно."""
+    if not hasattr(_pending, 'names'):
+        _pending.names = set()
+    _pending.names.add(name)
+    transaction.on_commit(_flush_pending)
+
+
+def get_version(name):
+    """Текущая версия справочника name, при отсутствии создается."""
+    return ReferenceDataVersion.objects.get_or_create(name=name)[0]
+
+
+def get_versions(names):
+    """Версии справочников names одним запросом: {name: version}."""
+    versions = dict(ReferenceDataVersion.objects.filter(
+        name__in=names).values_list('name', 'version'))
+    return {name: versions.get(name, 0) for name in names}
+
+
+def get_tag_ids():
+    """{slug: id} всех тегов, кешируется до изменения тегов."""
+    key = f'tag-ids:{get_versions((TAGS, ))[TAGS]}'
+    tag_ids = cache.get(key)
+    if tag_ids is None:
+        tag_ids = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(key, tag_ids, settings.REFERENCE_DATA_CACHE_TIMEOUT)
+    return tag_ids
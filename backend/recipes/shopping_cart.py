@@ -0,0 +1,107 @@
+"""Инкрементальное обновление материализованного списка покупок.
+
+ShoppingListItem хранит суммарное количество каждого ингредиента в корзине
+пользователя. Изменения применяются одним INSERT ... ON CONFLICT DO UPDATE
+(поддерживается PostgreSQL и SQLite 3.24+), после чего строки с нулевым
+количеством удаляются, а версия корзины пользователя увеличивается.
+"""
+from django.db import connection
+from django.db.models import F, Sum
+
+from recipes.models import Cart, RecipeIngredient, ShoppingListItem
+from users.models import User
+
+BATCH_SIZE = 1000
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def _upsert(select_sql, params):
+    item_table = _table(ShoppingListItem)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {item_table} (user_id, ingredient_id, amount) '
+            f'{select_sql} '
+            f'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+            f'SET amount = {item_table}.amount + excluded.amount',
+            params)
+
+
+def _cleanup(users):
+    ShoppingListItem.objects.filter(user__in=users, amount__lte=0).delete()
+    users.update(shopping_cart_version=F('shopping_cart_version') + 1)
+
+
+def _change_cart(user_id, recipe_ids, sign):
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    _upsert(
+        f'SELECT %s, ingredient_id, SUM(amount) * %s '
+        f'FROM {_table(RecipeIngredient)} '
+        f'WHERE recipe_id IN ({placeholders}) '
+        f'GROUP BY ingredient_id',
+        [user_id, sign, *recipe_ids])
+    _cleanup(User.objects.filter(pk=user_id))
+
+
+def add_to_shopping_list(user_id, recipe_ids):
+    """Добавление ингредиентов рецептов, положенных в корзину."""
+    _change_cart(user_id, recipe_ids, 1)
+
+
+def remove_from_shopping_list(user_id, recipe_ids):
+    """Вычитание ингредиентов рецептов, убранных из корзины."""
+    _change_cart(user_id, recipe_ids, -1)
+
+
+def recipe_ingredient_amounts(recipe):
+    """Текущее количество ингредиентов рецепта: {ingredient_id: amount}."""
+    return dict(RecipeIngredient.objects.filter(recipe=recipe).values_list(
+        'ingredient_id', 'amount'))
+
+
+def update_shopping_lists(recipe, old_amounts, new_amounts=None):
+    """Применение изменений ингредиентов рецепта к спискам покупок всех
+    пользователей, у которых он в корзине. Без new_amounts текущее
+    количество читается из БД."""
+    if new_amounts is None:
+        new_amounts = recipe_ingredient_amounts(recipe)
+    deltas = []
+    for ingredient_id in old_amounts.keys() | new_amounts.keys():
+        delta = (new_amounts.get(ingredient_id, 0)
+                 - old_amounts.get(ingredient_id, 0))
+        if delta:
+            deltas.extend((ingredient_id, delta))
+    if not deltas:
+        return
+    # Столбцы VALUES называются column1, column2 и в PostgreSQL, и в SQLite.
+    values = ', '.join(['(%s, %s)'] * (len(deltas) // 2))
+    _upsert(
+        f'SELECT cart.user_id, delta.column1, SUM(delta.column2) '
+        f'FROM {_table(Cart)} cart CROSS JOIN (VALUES {values}) delta '
+        f'WHERE cart.recipe_id = %s '
+        f'GROUP BY cart.user_id, delta.column1',
+        [*deltas, recipe.pk])
+    _cleanup(User.objects.filter(carts_user__recipe=recipe))
+
+
+def rebuild_shopping_lists(user_ids):
+    """Полный пересчет списков покупок пользователей по их корзинам."""
+    ShoppingListItem.objects.filter(user__in=user_ids).delete()
+    totals = Cart.objects.filter(user__in=user_ids).values(
+        'user', 'recipe__recipe_ingredients__ingredient').annotate(
+            total=Sum('recipe__recipe_ingredients__amount'))
+    ShoppingListItem.objects.bulk_create(
+        (ShoppingListItem(
+            user_id=row['user'],
+            ingredient_id=row['recipe__recipe_ingredients__ingredient'],
+            amount=row['total'])
+         for row in totals.iterator()
+         if row['recipe__recipe_ingredients__ingredient'] is not None),
+        batch_size=BATCH_SIZE)
+    User.objects.filter(pk__in=user_ids).update(
+        shopping_cart_version=F('shopping_cart_version') + 1)
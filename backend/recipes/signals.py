@@ -0,0 +1,120 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from recipes.counters import change_counter
+from recipes.feed import follow_added, forget_author, push_recipes
+from recipes.images import schedule_thumbnails
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (Cart, Favorite, Ingredient, Recipe,
+                            RecipeIngredient, RecipeTag, Tag)
+from recipes.reference_data import (INGREDIENTS, RECIPES, TAGS,
+                                    bump_version_on_commit)
+from recipes.shopping_cart import (add_to_shopping_list,
+                                   rebuild_shopping_lists,
+                                   remove_from_shopping_list)
+from users.models import Follow, User
+
+
+@receiver(post_save, sender=Cart)
+def cart_saved(sender, instance, created, **kwargs):
+    if created:
+        add_to_shopping_list(instance.user_id, [instance.recipe_id])
+    else:
+        rebuild_shopping_lists([instance.user_id])
+
+
+@receiver(pre_delete, sender=Cart)
+def cart_deleted(sender, instance, **kwargs):
+    # pre_delete: при каскадном удалении рецепта его ингредиенты
+    # к post_delete корзины могут быть уже удалены.
+    remove_from_shopping_list(instance.user_id, [instance.recipe_id])
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_saved(sender, instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, 'favorites_count', [instance.recipe_id], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    change_counter(Recipe, 'favorites_count', [instance.recipe_id], -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, 'recipes_count', [instance.author_id], 1)
+        push_recipes([instance.pk])
+    if instance.image and (
+            instance.thumbnails.get('source') != instance.image.name):
+        schedule_thumbnails(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    change_counter(User, 'recipes_count', [instance.author_id], -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        change_counter(User, 'followers_count', [instance.following_id], 1)
+        follow_added(instance.user_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    change_counter(User, 'followers_count', [instance.following_id], -1)
+    # Без возврата автора в рассылку: при каскадном удалении автора его
+    # рецепты могут быть уже удалены. feed_pull не теряет рецептов,
+    # возврат выполняют отписка через API и rebuild_feed.
+    forget_author(instance.user_id, instance.following_id)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    bump_version_on_commit(INGREDIENTS)
+    # После увеличения версии: перестроенный индекс получит новую.
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    bump_version_on_commit(TAGS)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(post_save, sender=RecipeTag)
+@receiver(post_delete, sender=RecipeTag)
+def recipe_catalogue_changed(sender, **kwargs):
+    bump_version_on_commit(RECIPES)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_relations_changed(sender, action, **kwargs):
+    # set() и add() с промежуточной моделью не вызывают post_save.
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_version_on_commit(RECIPES)
+
+
+# Поля автора, которые входят в общий кеш списка рецептов.
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields, **kwargs):
+    # Вход обновляет только last_login и кеш не затрагивает.
+    if created or (update_fields is not None
+                   and not AUTHOR_FIELDS & set(update_fields)):
+        return
+    if Recipe.objects.filter(author=instance).exists():
+        bump_version_on_commit(RECIPES)
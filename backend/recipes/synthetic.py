@@ -0,0 +1,228 @@
+import itertools
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+
+from recipes.bulk import insert_rows
+from recipes.counters import recount_counters
+from recipes.feed import rebuild_timelines
+from recipes.models import (Cart, Favorite, Ingredient, Recipe,
+                            RecipeIngredient, RecipeTag, Tag)
+from recipes.reference_data import INGREDIENTS, RECIPES, TAGS, bump_version
+from recipes.shopping_cart import rebuild_shopping_lists
+from recipes.similarity import rebuild_index
+from users.models import Follow, User
+
+SYNTHETIC_PREFIX = 'synthetic'
+SYNTHETIC_PASSWORD = 'synthetic-password'
+SYNTHETIC_IMAGE = f'{settings.IMAGE_DIRECTORY}synthetic.png'
+BATCH_SIZE = 1000
+# Строк в пачке generate_dataset: COPY выгоднее большими пачками.
+GENERATE_BATCH_SIZE = 10000
+
+TAG_COLORS = ('#E26C2D', '#49B64E', '#8775D2', '#F5C242', '#3B8EDE')
+MEASUREMENT_UNITS = ('г', 'мл', 'шт', 'ст. л.', 'ч. л.', 'по вкусу')
+
+
+def zipf_weights(count, exponent):
+    """Накопленные веса закона Ципфа: вес элемента ранга r - 1 / r**exponent.
+    """
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def _batches(iterable, size=GENERATE_BATCH_SIZE):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _sample(rnd, population, cum_weights, count, exclude=None):
+    """Не более count разных элементов population, выбранных с весами."""
+    count = min(count, len(population) - (exclude is not None))
+    chosen = set()
+    # Популярные элементы выпадают повторно, поэтому с запасом.
+    while len(chosen) < count:
+        for item in rnd.choices(population, cum_weights=cum_weights,
+                                k=2 * (count - len(chosen))):
+            if item != exclude:
+                chosen.add(item)
+    return list(chosen)[:count]
+
+
+def _degree(rnd, mean, exact=False):
+    """Число связей объекта: экспоненциальное распределение со средним
+    mean, у большинства меньше среднего, у немногих - много больше. При
+    exact - ровно mean."""
+    if exact or mean <= 0:
+        return max(mean, 0)
+    return round(rnd.expovariate(1 / mean))
+
+
+def _insert(model, columns, rows, progress):
+    written = 0
+    for batch in _batches(rows):
+        with transaction.atomic():
+            insert_rows(model, columns, batch)
+        written += len(batch)
+        progress(model._meta.verbose_name_plural, written)
+    return written
+
+
+def generate_dataset(users=1000, recipes_per_user=5, ingredients=2000,
+                     tags=12, ingredients_per_recipe=8, tags_per_recipe=2,
+                     follows_per_user=20, favorites_per_user=10,
+                     carts_per_user=3, exponent=1.1, exact=False, seed=0,
+                     progress=lambda label, count: None):
+    """Наполнение БД синтетическими данными с распределениями, похожими на
+    рабочие: на кого подписываются, кто пишет рецепты, какие ингредиенты и
+    теги в них входят и какие рецепты добавляют в избранное и корзину -
+    по закону Ципфа (немного очень популярных объектов и длинный хвост),
+    число связей каждого пользователя и рецепта - экспоненциальное.
+    exponent=0 - равномерный выбор, exact - у каждого пользователя ровно
+    recipes_per_user рецептов и ровно заданное число связей.
+
+    Данные пишутся пачками в отдельных транзакциях через insert_rows (на
+    PostgreSQL - COPY) и не держатся в памяти целиком. Сигналы не
+    вызываются: списки покупок, счетчики и версии справочников
+    пересчитываются в конце. progress(метка, число) вызывается после
+    каждой пачки. Возвращает число созданных объектов каждого типа.
+    """
+    synthetic_users = User.objects.filter(
+        username__startswith=SYNTHETIC_PREFIX)
+    if synthetic_users.exists():
+        raise ValueError('Synthetic data already exists!')
+    rnd = random.Random(seed)
+    password = make_password(SYNTHETIC_PASSWORD)
+    counts = {}
+
+    created = 0
+    for batch in _batches(
+            User(username=f'{SYNTHETIC_PREFIX}{index}',
+                 email=f'{SYNTHETIC_PREFIX}{index}@example.com',
+                 first_name=f'Имя{index}',
+                 last_name=f'Фамилия{index}',
+                 password=password)
+            for index in range(users)):
+        User.objects.bulk_create(batch)
+        created += len(batch)
+        progress(User._meta.verbose_name_plural, created)
+    Tag.objects.bulk_create(
+        (Tag(name=f'{SYNTHETIC_PREFIX} тег {index}',
+             color=TAG_COLORS[index % len(TAG_COLORS)],
+             slug=f'{SYNTHETIC_PREFIX}-{index}')
+         for index in range(tags)),
+        batch_size=BATCH_SIZE, ignore_conflicts=True)
+    for batch in _batches(
+            (f'{SYNTHETIC_PREFIX} ингредиент {index}',
+             MEASUREMENT_UNITS[index % len(MEASUREMENT_UNITS)])
+            for index in range(ingredients)):
+        insert_rows(Ingredient, ('name', 'measurement_unit'), batch,
+                    'ON CONFLICT (name, measurement_unit) DO NOTHING')
+
+    # Популярность - по рангу в случайном порядке, а не по порядку создания.
+    user_ids = list(synthetic_users.values_list('id', flat=True))
+    tag_ids = list(Tag.objects.filter(
+        slug__startswith=SYNTHETIC_PREFIX).values_list('id', flat=True))
+    ingredient_ids = list(Ingredient.objects.filter(
+        name__startswith=SYNTHETIC_PREFIX).values_list('id', flat=True))
+    for ids in (user_ids, tag_ids, ingredient_ids):
+        rnd.shuffle(ids)
+    user_weights = zipf_weights(len(user_ids), exponent)
+    counts.update(users=len(user_ids), tags=len(tag_ids),
+                  ingredients=len(ingredient_ids))
+
+    counts['follows'] = _insert(
+        Follow, ('user_id', 'following_id'),
+        ((user_id, following_id)
+         for user_id in user_ids
+         for following_id in _sample(
+             rnd, user_ids, user_weights,
+             _degree(rnd, follows_per_user, exact), exclude=user_id)),
+        progress)
+
+    # Рецепты популярных авторов, опубликованные за последний год.
+    now = timezone.now()
+    if exact:
+        authors = [author_id for author_id in user_ids
+                   for _ in range(recipes_per_user)]
+    else:
+        authors = rnd.choices(user_ids, cum_weights=user_weights,
+                              k=users * recipes_per_user)
+    _insert(
+        Recipe, ('author_id', 'name', 'text', 'cooking_time', 'image',
+                 'pub_date', 'favorites_count', 'thumbnails'),
+        ((author_id, f'{SYNTHETIC_PREFIX} рецепт {index}',
+          'Синтетический рецепт для нагрузочного тестирования.',
+          rnd.randint(1, 180), SYNTHETIC_IMAGE,
+          connection.ops.adapt_datetimefield_value(
+              now - timedelta(seconds=rnd.randrange(365 * 24 * 60 * 60))),
+          0, '{}')
+         for index, author_id in enumerate(authors)),
+        progress)
+    recipe_ids = list(Recipe.objects.filter(
+        name__startswith=SYNTHETIC_PREFIX).values_list('id', flat=True))
+    rnd.shuffle(recipe_ids)
+    recipe_weights = zipf_weights(len(recipe_ids), exponent)
+    counts['recipes'] = len(recipe_ids)
+
+    ingredient_weights = zipf_weights(len(ingredient_ids), exponent)
+    _insert(
+        RecipeIngredient, ('recipe_id', 'ingredient_id', 'amount'),
+        ((recipe_id, ingredient_id, rnd.randint(1, 500))
+         for recipe_id in recipe_ids
+         for ingredient_id in _sample(
+             rnd, ingredient_ids, ingredient_weights,
+             max(1, _degree(rnd, ingredients_per_recipe, exact)))),
+        progress)
+    tag_weights = zipf_weights(len(tag_ids), exponent)
+    _insert(
+        RecipeTag, ('recipe_id', 'tag_id'),
+        ((recipe_id, tag_id)
+         for recipe_id in recipe_ids
+         for tag_id in _sample(
+             rnd, tag_ids, tag_weights,
+             tags_per_recipe if exact
+             else rnd.randint(1, 2 * tags_per_recipe - 1))),
+        progress)
+
+    for model, mean, label in ((Favorite, favorites_per_user, 'favorites'),
+                               (Cart, carts_per_user, 'carts')):
+        counts[label] = _insert(
+            model, ('user_id', 'recipe_id'),
+            ((user_id, recipe_id)
+             for user_id in user_ids
+             for recipe_id in _sample(rnd, recipe_ids, recipe_weights,
+                                      _degree(rnd, mean, exact))),
+            progress)
+
+    with transaction.atomic():
+        rebuild_shopping_lists(synthetic_users.values('pk'))
+        recount_counters()
+        rebuild_timelines()
+        rebuild_index()
+    bump_version(TAGS, INGREDIENTS, RECIPES)
+    return counts
+
+
+def seed_dataset(users=20, tags=6, ingredients=200, recipes_per_user=5,
+                 ingredients_per_recipe=8, tags_per_recipe=2,
+                 follows_per_user=5, favorites_per_user=5,
+                 carts_per_user=5, seed=0):
+    """Небольшой набор для бенчмарков маршрутов: generate_dataset с
+    равномерным выбором и ровно заданным числом связей у каждого
+    пользователя и рецепта."""
+    return generate_dataset(
+        users=users, recipes_per_user=recipes_per_user,
+        ingredients=ingredients, tags=tags,
+        ingredients_per_recipe=ingredients_per_recipe,
+        tags_per_recipe=tags_per_recipe, follows_per_user=follows_per_user,
+        favorites_per_user=favorites_per_user, carts_per_user=carts_per_user,
+        exponent=0, exact=True, seed=seed)
@@ -0,0 +1,108 @@
+"""Избранное, корзина и подписки пользователя.
+
+Связи добавляются одним INSERT ... SELECT ... ON CONFLICT DO NOTHING
+RETURNING (строки только для существующих объектов, повторы отсекает
+уникальное ограничение) и удаляются одним DELETE ... RETURNING, поэтому
+повторные и одновременные запросы идемпотентны. Запросы выполняются в
+обход сигналов: счетчики, списки покупок и ленты обновляются здесь явно и
+только для действительно затронутых строк.
+"""
+from django.db import connection, transaction
+
+from recipes.counters import change_counter
+from recipes.feed import follow_added, follow_removed
+from recipes.models import Favorite, Recipe
+from recipes.shopping_cart import (add_to_shopping_list,
+                                   remove_from_shopping_list)
+from users.models import Follow, User
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def _insert(model, user_id, field, pks):
+    """Связи user_id с существующими объектами pks поля field, которых еще
+    нет. Возвращает pks добавленных связей."""
+    if not pks:
+        return []
+    table = _quote(model._meta.db_table)
+    target = model._meta.get_field(field).related_model._meta
+    column = _quote(model._meta.get_field(field).column)
+    placeholders = ', '.join(['%s'] * len(pks))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (user_id, {column}) '
+            f'SELECT %s, {_quote(target.pk.column)} '
+            f'FROM {_quote(target.db_table)} '
+            f'WHERE {_quote(target.pk.column)} IN ({placeholders}) '
+            f'ON CONFLICT DO NOTHING RETURNING {column}',
+            [user_id, *pks])
+        return [pk for pk, in cursor.fetchall()]
+
+
+def _delete(model, user_id, field, pks):
+    """Удаление связей user_id с объектами pks поля field. Возвращает pks
+    удаленных связей."""
+    if not pks:
+        return []
+    column = _quote(model._meta.get_field(field).column)
+    placeholders = ', '.join(['%s'] * len(pks))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {_quote(model._meta.db_table)} '
+            f'WHERE user_id = %s AND {column} IN ({placeholders}) '
+            f'RETURNING {column}',
+            [user_id, *pks])
+        return [pk for pk, in cursor.fetchall()]
+
+
+def _recipes_changed(model, user_id, recipe_ids, sign):
+    if not recipe_ids:
+        return
+    if model is Favorite:
+        change_counter(Recipe, 'favorites_count', recipe_ids, sign)
+    elif sign > 0:
+        add_to_shopping_list(user_id, recipe_ids)
+    else:
+        remove_from_shopping_list(user_id, recipe_ids)
+
+
+@transaction.atomic
+def add_recipes(model, user_id, recipe_ids):
+    """Добавление рецептов recipe_ids в избранное или корзину (model).
+    Возвращает id добавленных рецептов: без несуществующих и уже
+    добавленных."""
+    added = _insert(model, user_id, 'recipe', recipe_ids)
+    _recipes_changed(model, user_id, added, 1)
+    return added
+
+
+@transaction.atomic
+def remove_recipes(model, user_id, recipe_ids):
+    """Удаление рецептов recipe_ids из избранного или корзины (model).
+    Возвращает id действительно удаленных рецептов."""
+    removed = _delete(model, user_id, 'recipe', recipe_ids)
+    _recipes_changed(model, user_id, removed, -1)
+    return removed
+
+
+@transaction.atomic
+def follow(user_id, following_id):
+    """Подписка на пользователя. False, если она уже есть или
+    пользователя не существует."""
+    if not _insert(Follow, user_id, 'following', [following_id]):
+        return False
+    change_counter(User, 'followers_count', [following_id], 1)
+    follow_added(user_id, following_id)
+    return True
+
+
+@transaction.atomic
+def unfollow(user_id, following_id):
+    """Отписка от пользователя. False, если подписки не было."""
+    if not _delete(Follow, user_id, 'following', [following_id]):
+        return False
+    change_counter(User, 'followers_count', [following_id], -1)
+    follow_removed(user_id, following_id)
+    return True
@@ -38,6 +38,8 @@ class UserAdmin(UserAdmin):
     list_display = (
         'username',
         'email',
+        'recipes_count',
+        'followers_count',
     )
     search_fields = ('username',)
     list_filter = ('username', 'email')
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 21:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_auto_20261018_2018'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='feed_pull_since',
+            field=models.DateTimeField(editable=False, null=True, verbose_name='Рецепты в ленты при чтении с'),
+        ),
+    ]
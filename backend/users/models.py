@@ -1,12 +1,28 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
 
 MAX_FIO_LENGTH = 150
 MAX_EMAIL_LENGTH = 254
 
 
+class UserCustomQuerySet(models.QuerySet):
+    '''Менеджер для создания доп поля is_subscribed.'''
+    def add_is_subscribed_subquery(self, **kwargs):
+        is_subscribed_subquery = Follow.objects.filter(
+            user=kwargs.get('user'),
+            following=models.OuterRef('pk')).values('pk')[:1]
+        return self.annotate(
+            is_subscribed=models.Exists(is_subscribed_subquery))
+
+
+class CustomUserManager(UserManager.from_queryset(UserCustomQuerySet)):
+    """Менеджер пользователей с методами UserCustomQuerySet."""
+
+
 class User(AbstractUser):
     """Класс пользователей."""
+    objects = CustomUserManager()
+
     email = models.EmailField(
         verbose_name='email address',
         max_length=MAX_EMAIL_LENGTH,
@@ -24,6 +40,31 @@ class User(AbstractUser):
         null=False,
         max_length=MAX_FIO_LENGTH,
     )
+    shopping_cart_version = models.PositiveIntegerField(
+        'Версия корзины',
+        default=0,
+        editable=False,
+    )
+    recipes_count = models.PositiveIntegerField(
+        'Число рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков',
+        default=0,
+        editable=False,
+    )
+    feed_pull = models.BooleanField(
+        'Рецепты в ленты при чтении',
+        default=False,
+        editable=False,
+    )
+    feed_pull_since = models.DateTimeField(
+        'Рецепты в ленты при чтении с',
+        null=True,
+        editable=False,
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name')
@@ -32,6 +73,11 @@ class User(AbstractUser):
         ordering = ('username',)
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
+        indexes = [
+            # Популярные авторы, рецепты которых не рассылаются по лентам.
+            models.Index(fields=['id'], condition=models.Q(feed_pull=True),
+                         name='user_feed_pull_idx'),
+        ]
 
     def __str__(self):
         return self.username
@@ -42,12 +88,16 @@ class Follow(models.Model):
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        # Индекс - уникальное ограничение (user, following).
+        db_index=False,
         related_name='follower',
         verbose_name='Кто подписался',
     )
     following = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
+        # Индекс - follow_following_user_idx.
+        db_index=False,
         related_name='following',
         verbose_name='На кого подписался',
     )
@@ -62,6 +112,11 @@ class Follow(models.Model):
             models.CheckConstraint(check=~models.Q(user=models.F('following')),
                                    name='prevent_self_follow', )
         ]
+        indexes = [
+            # Подписчики автора и подписка текущего пользователя на него.
+            models.Index(fields=['following', 'user'],
+                         name='follow_following_user_idx'),
+        ]
 
     def __str__(self):
         return f'{ self.user } subscribed to { self.following }'